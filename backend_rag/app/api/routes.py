@@ -1,18 +1,27 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import Response, JSONResponse, FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request, Query
+from fastapi.responses import Response, JSONResponse, FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 import uuid
+import asyncio
+import math
 from pathlib import Path
 from pydantic import BaseModel
+from prometheus_client import CONTENT_TYPE_LATEST
 import os
 import logging
 import shutil
 import json
-import PyPDF2
 
 from utils.file_processing import FileProcessor
 from utils.rag_app_weav import RAGProcessor
+from utils.metrics import generate_metrics, record_request
+from utils.resilience import CircuitOpenError
+from utils.admission import AdmissionRejected, AdmissionTicket
+from utils.deadline import Deadline, DeadlineExceeded, run_within
+from utils.shared_state import SharedStateStore
+from utils.timing import StageTimer
 from app.models import Source
 
 # Configure logging
@@ -23,7 +32,6 @@ router = APIRouter(prefix="/api")
 
 # Initialize processors
 file_processor = FileProcessor()
-rag_processor = RAGProcessor()
 
 # Store uploaded files in a consistent location
 UPLOAD_DIR = Path("uploads")
@@ -47,17 +55,121 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     documentId: Optional[str] = None
+    documentIds: Optional[List[str]] = None
+    sessionId: Optional[str] = None
     chatHistory: Optional[List[ChatMessage]] = None
 
+    def history(self) -> Optional[List[Dict[str, str]]]:
+        """Client-side chat history as plain dicts"""
+        if not self.chatHistory:
+            return None
+        return [{"sender": m.sender, "content": m.content} for m in self.chatHistory]
+
+class BatchQuestion(BaseModel):
+    message: str
+    documentId: Optional[str] = None
+    documentIds: Optional[List[str]] = None
+
+class BatchChatRequest(BaseModel):
+    questions: List[BatchQuestion]
+
 class ChatResponse(BaseModel):
     answer: str
     sources: List[Source]
+    timings: Optional[Dict[str, float]] = None
+    usage: Optional[Dict[str, int]] = None
+    deadline_exceeded: bool = False
+
+def get_rag_processor(request: Request) -> RAGProcessor:
+    """Return the shared RAGProcessor created in the app lifespan"""
+    rag_processor = request.app.state.rag_processor
+    try:
+        rag_processor.ensure_connected()
+    except Exception as e:
+        logger.error(f"Vector store unavailable: {str(e)}")
+        raise HTTPException(status_code=503, detail="Vector store unavailable, please retry later")
+    # Pick up documents uploaded or deleted through other workers
+    rag_processor.sync_shared_state()
+    return rag_processor
+
+def upstream_unavailable(error: CircuitOpenError) -> HTTPException:
+    """503 telling the client when the failing upstream will be tried again"""
+    logger.warning(f"Failing fast: {str(error)}")
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(math.ceil(error.retry_after))}
+    )
+
+def request_deadline(http_request: Request, rag_processor: RAGProcessor) -> Deadline:
+    """Deadline of a request: the timeout header (in seconds) when valid, else the default"""
+    timeout = rag_processor.request_timeout
+    value = http_request.headers.get(rag_processor.deadline_header)
+    if value:
+        try:
+            timeout = float(value) if float(value) > 0 else timeout
+        except ValueError:
+            logger.warning(f"Ignoring invalid {rag_processor.deadline_header} header: {value}")
+    return Deadline(min(timeout, rag_processor.max_request_timeout))
+
+async def admit_chat(http_request: Request, rag_processor: RAGProcessor, deadline: Deadline) -> AdmissionTicket:
+    """Wait for a chat slot, or fail fast with 503 when the server is saturated"""
+    client = http_request.client.host if http_request.client else ""
+    client_id = http_request.headers.get(rag_processor.client_id_header) or client
+    try:
+        # Time spent queueing counts against the request's deadline
+        return await rag_processor.chat_admission.acquire(client_id, timeout=deadline.remaining())
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected chat request from {client_id}: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
+def get_shared_state(request: Request) -> Optional[SharedStateStore]:
+    """Return the store shared by the worker processes, if SHARED_STATE_PATH is set"""
+    rag_processor = getattr(request.app.state, "rag_processor", None)
+    return rag_processor.shared_state if rag_processor is not None else None
+
+class SearchHighlights(BaseModel):
+    matches: List[List[int]]
+    snippets: List[str]
+
+class SearchResult(BaseModel):
+    id: Optional[str] = None
+    document_id: Optional[str] = None
+    file_name: Optional[str] = None
+    page: Optional[int] = None
+    start_line: Optional[int] = None
+    end_line: Optional[int] = None
+    section_title: Optional[str] = None
+    service_id: Optional[str] = None
+    service_name: Optional[str] = None
+    score: Optional[float] = None
+    text: str
+    highlights: SearchHighlights
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+    took_ms: float
 
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@router.get("/stats")
+async def get_stats(rag_processor: RAGProcessor = Depends(get_rag_processor)):
+    """Cache statistics such as answer cache hit rate and latency saved"""
+    return rag_processor.stats()
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus metrics: request latencies, in-flight requests, stage timings, tokens and cache counters"""
+    return Response(content=generate_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 @router.get("/previews/{document_id}/{page}")
 async def get_preview(document_id: str, page: int):
     try:
@@ -120,21 +232,28 @@ async def get_document(document_id: str):
         )
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request, rag_processor: RAGProcessor = Depends(get_rag_processor)):
     """Chat with the RAG system"""
+    deadline = request_deadline(http_request, rag_processor)
+    ticket = await admit_chat(http_request, rag_processor, deadline)
     try:
         logger.info(f"Received chat request: {request.message}")
         
-        # Initialize RAG processor
-        rag_processor = RAGProcessor()
-        
         # Get response
-        answer, sources = rag_processor.get_response(
+        timer = StageTimer()
+        answer, sources = await rag_processor.aget_response(
             query=request.message,
-            document_id=request.documentId
+            document_id=request.documentId,
+            document_ids=request.documentIds,
+            chat_history=request.history(),
+            session_id=request.sessionId,
+            timer=timer,
+            deadline=deadline
         )
+        timer.mark("total")
+        record_request(timer.timings, timer.counters)
         
-        logger.info("Generated response successfully")
+        logger.info(f"Generated response successfully, timings: {timer.timings}, usage: {timer.counters}")
         
         # Convert sources to match the Source model
         formatted_sources = [
@@ -152,19 +271,151 @@ async def chat(request: ChatRequest):
             ) for source in sources
         ]
         
-        return ChatResponse(answer=answer, sources=formatted_sources)
+        return ChatResponse(
+            answer=answer,
+            sources=formatted_sources,
+            timings=timer.timings,
+            usage=timer.counters,
+            deadline_exceeded=bool(timer.counters.get("deadline_exceeded"))
+        )
         
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
+    except DeadlineExceeded as e:
+        logger.warning(f"Chat request timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error in chat: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"Error processing chat request: {str(e)}"
         )
+    finally:
+        ticket.release()
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.get("/search", response_model=SearchResponse)
+async def search(
+    http_request: Request,
+    q: str = Query(..., min_length=1),
+    top_k: int = Query(10, ge=1, le=100),
+    document_ids: Optional[List[str]] = Query(None, alias="documentId"),
+    score_threshold: Optional[float] = None,
+    mode: Optional[str] = Query(None, pattern="^(vector|hybrid)$"),
+    rag_processor: RAGProcessor = Depends(get_rag_processor)
+):
+    """Retrieval-only search over the indexed chunks, without an LLM call"""
+    try:
+        timer = StageTimer()
+        results = await run_within(
+            request_deadline(http_request, rag_processor),
+            "search",
+            asyncio.to_thread(rag_processor.search, q, top_k, document_ids, score_threshold, mode)
+        )
+        return SearchResponse(query=q, results=results, took_ms=round(timer.elapsed_ms(), 2))
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
+    except DeadlineExceeded as e:
+        logger.warning(f"Search request timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in search: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing search request: {str(e)}"
+        )
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request, rag_processor: RAGProcessor = Depends(get_rag_processor)):
+    """Chat with the RAG system, streaming sources and answer tokens as server-sent events"""
+    logger.info(f"Received streaming chat request: {request.message}")
+    # The slot is held until the stream ends (or, if the client leaves before
+    # it starts, until the response's background task runs)
+    deadline = request_deadline(http_request, rag_processor)
+    ticket = await admit_chat(http_request, rag_processor, deadline)
+    timer = StageTimer()
+
+    async def event_stream():
+        try:
+            async for event, data in rag_processor.astream_response(
+                query=request.message,
+                document_id=request.documentId,
+                document_ids=request.documentIds,
+                chat_history=request.history(),
+                session_id=request.sessionId,
+                timer=timer,
+                deadline=deadline
+            ):
+                # Time to first byte is when the first event (the sources) leaves the server
+                timer.mark("ttfb")
+                if event == "done":
+                    data["timings"] = timer.timings
+                    record_request(timer.timings, timer.counters)
+                    logger.info(f"Streamed response, timings: {timer.timings}")
+                yield _sse_event(event, data)
+        except DeadlineExceeded as e:
+            logger.warning(f"Streaming chat request timed out: {str(e)}")
+            yield _sse_event("error", {"detail": str(e), "deadline_exceeded": True})
+        except Exception as e:
+            logger.error(f"Error in streaming chat: {str(e)}", exc_info=True)
+            yield _sse_event("error", {"detail": f"Error processing chat request: {str(e)}"})
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(ticket.release)
+    )
+
+@router.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest, http_request: Request, rag_processor: RAGProcessor = Depends(get_rag_processor)):
+    """Answer many questions at once, streaming one JSON line per result as each completes"""
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions provided")
+    if len(request.questions) > rag_processor.batch_max_questions:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many questions: {len(request.questions)} > {rag_processor.batch_max_questions}"
+        )
+    logger.info(f"Received batch chat request with {len(request.questions)} questions")
+    # A batch holds one chat slot until its stream ends, like /chat/stream;
+    # the deadline covers the whole batch
+    deadline = request_deadline(http_request, rag_processor)
+    ticket = await admit_chat(http_request, rag_processor, deadline)
+
+    async def result_stream():
+        try:
+            questions = [
+                {"message": q.message, "documentId": q.documentId, "documentIds": q.documentIds}
+                for q in request.questions
+            ]
+            async for result in rag_processor.abatch_responses(questions, deadline=deadline):
+                if "timings" in result:
+                    record_request(result["timings"], result.get("usage", {}))
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"Error in batch chat: {str(e)}", exc_info=True)
+            yield json.dumps({"error": f"Error processing batch request: {str(e)}"}) + "\n"
+        finally:
+            ticket.release()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson", background=BackgroundTask(ticket.release))
 
 @router.delete("/documents/{document_id}")
-async def delete_document(document_id: str):
+async def delete_document(document_id: str, rag_processor: RAGProcessor = Depends(get_rag_processor)):
     try:
         logger.info(f"Deleting document: {document_id}")
+
+        # Delete indexed chunks and any cached answers that cited them
+        try:
+            await asyncio.to_thread(rag_processor.delete_document, document_id)
+        except Exception as e:
+            logger.error(f"Error deleting indexed chunks: {str(e)}", exc_info=True)
         
         # Check preview directory
         preview_dir = Path("previews") / document_id
@@ -188,6 +439,9 @@ async def delete_document(document_id: str):
                 logger.info(f"Deleted uploaded file: {upload_file}")
             except Exception as e:
                 logger.error(f"Error deleting uploaded file: {str(e)}", exc_info=True)
+
+        if rag_processor.shared_state is not None:
+            await asyncio.to_thread(rag_processor.shared_state.remove_document, document_id)
             
         return JSONResponse(
             status_code=200,
@@ -262,7 +516,7 @@ async def download_document(document_id: str):
         )
 
 @router.post("/files")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), rag_processor: RAGProcessor = Depends(get_rag_processor)):
     try:
         document_id = str(uuid.uuid4())
         uploads_dir = Path("uploads")
@@ -275,7 +529,8 @@ async def upload_file(file: UploadFile = File(...)):
             shutil.copyfileobj(file.file, buffer)
             
         # Process document and get preview zones
-        process_result = rag_processor.process_document(file_path, document_id)
+        # Embedding and inserting every chunk blocks, so keep it off the event loop
+        process_result = await asyncio.to_thread(rag_processor.process_document, file_path, document_id)
         
         # Save preview data to a JSON file
         preview_data = {
@@ -286,6 +541,18 @@ async def upload_file(file: UploadFile = File(...)):
             json.dump(preview_data, f, ensure_ascii=False, indent=2)
         
         stats = file_path.stat()
+
+        # List the document for every worker without re-reading the file
+        if rag_processor.shared_state is not None:
+            await asyncio.to_thread(rag_processor.shared_state.upsert_document, {
+                "id": document_id,
+                "name": file.filename,
+                "type": file_extension.lower()[1:],
+                "size": stats.st_size,
+                "uploadedAt": stats.st_mtime,
+                "pageCount": process_result.get("page_count", 1),
+                "previewZones": process_result.get("preview_zones", [])
+            }, str(file_path))
         
         return {
             "success": True,
@@ -302,6 +569,8 @@ async def upload_file(file: UploadFile = File(...)):
             }
         }
 
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         logger.error(f"Error uploading file: {str(e)}")
         raise HTTPException(
@@ -356,7 +625,7 @@ async def get_document_preview(document_id: str):
         )
 
 @router.get("/documents")
-async def list_documents():
+async def list_documents(shared_state: Optional[SharedStateStore] = Depends(get_shared_state)):
     """List all documents"""
     try:
         print("GET /api/documents - Starting request")
@@ -366,14 +635,16 @@ async def list_documents():
             print(f"Uploads directory does not exist: {uploads_dir}")
             return {"documents": []}
 
-        documents = []
+        # Documents in the shared catalog are listed without touching their files
+        documents = await asyncio.to_thread(shared_state.list_documents) if shared_state is not None else []
+        cataloged = {document["id"] for document in documents}
         print(f"Scanning directory: {uploads_dir}")
         
         for file_path in uploads_dir.glob("*"):
             print(f"Found file: {file_path}")
             
             # Skip preview JSON files and non-files
-            if not file_path.is_file() or file_path.suffix == '.json':
+            if not file_path.is_file() or file_path.suffix == '.json' or file_path.stem in cataloged:
                 print(f"Skipping file: {file_path}")
                 continue
                 
@@ -408,6 +679,7 @@ async def list_documents():
                 # Get page count for PDFs
                 if file_path.suffix.lower() == '.pdf':
                     try:
+                        import PyPDF2
                         with open(file_path, 'rb') as pdf_file:
                             pdf_reader = PyPDF2.PdfReader(pdf_file)
                             doc_info["pageCount"] = len(pdf_reader.pages)
@@ -416,6 +688,8 @@ async def list_documents():
                         print(f"Error reading PDF page count for {file_path.name}: {str(e)}")
 
                 documents.append(doc_info)
+                if shared_state is not None:
+                    await asyncio.to_thread(shared_state.upsert_document, doc_info, str(file_path))
                 
             except Exception as e:
                 print(f"Error processing file {file_path}: {str(e)}")
@@ -0,0 +1,23 @@
+from dotenv import load_dotenv
+import logging
+
+from utils.rag_app_weav import RAGProcessor
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def backfill_service_fields():
+    """Store parsed service fields on chunks ingested before they were extracted at ingest time"""
+    load_dotenv()
+    rag_processor = RAGProcessor()
+    rag_processor.connect()
+    try:
+        updated = rag_processor.backfill_service_fields()
+        logger.info(f"Backfill complete: {updated} chunks updated")
+    finally:
+        rag_processor.cleanup()
+
+
+if __name__ == "__main__":
+    backfill_service_fields()
@@ -0,0 +1,37 @@
+import os
+import resource
+import statistics
+from typing import Dict, List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_stats(latencies: List[float]) -> Dict[str, float]:
+    """Summary statistics of latencies given in milliseconds"""
+    return {
+        "runs": len(latencies),
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies),
+    }
+
+
+def use_local_backends(llm_latency_ms: float = 0.0, token_latency_ms: float = 0.0) -> None:
+    """Select the in-memory vector store, hashing embeddings and echo LLM (set before importing server)"""
+    os.environ["VECTOR_STORE_BACKEND"] = "memory"
+    os.environ["EMBEDDINGS_BACKEND"] = "hashing"
+    os.environ["LLM_BACKEND"] = "echo"
+    os.environ["ECHO_LLM_LATENCY_MS"] = str(llm_latency_ms)
+    os.environ["ECHO_LLM_TOKEN_LATENCY_MS"] = str(token_latency_ms)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB (Linux reports KiB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -0,0 +1,130 @@
+"""Synthetic service-catalogue corpora in TXT, PDF and DOCX for the benchmarks.
+
+Every document holds service records in the format the ingestion pipeline
+parses (``ID:``, ``Nom du service EN:``, ``DESCRIPTION EN EN:``, ``Lien EN:``).
+Generation is deterministic for a given seed.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+import random
+
+WORDS = (
+    "passport licence permit renewal application benefit tax credit pension health card "
+    "vehicle registration business grant student loan housing subsidy immigration visa "
+    "citizenship employment insurance child care disability support veteran record "
+    "certificate birth marriage address change online form office appointment fee refund"
+).split()
+
+
+@dataclass
+class ServiceRecord:
+    service_id: str
+    name: str
+    description: str
+    url: str
+
+    def lines(self) -> List[str]:
+        return [
+            f"ID: {self.service_id}",
+            f"Nom du service EN: {self.name}",
+            f"DESCRIPTION EN EN: {self.description}",
+            f"Lien EN: {self.url}",
+        ]
+
+
+def make_records(count: int, seed: int = 0, description_words: int = 30) -> List[ServiceRecord]:
+    """Deterministic service records with names and descriptions drawn from a small vocabulary"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        name = " ".join(rng.choice(WORDS) for _ in range(3)).title()
+        description = " ".join(rng.choice(WORDS) for _ in range(description_words))
+        records.append(ServiceRecord(
+            service_id=f"SRV-{seed * 100000 + i:06d}",
+            name=name,
+            description=description.capitalize(),
+            url=f"https://example.org/services/{seed}/{i}"
+        ))
+    return records
+
+
+def write_txt(path: Path, records: List[ServiceRecord]) -> None:
+    """One record per paragraph; the TXT ingester chunks on blank lines"""
+    path.write_text("\n\n".join("\n".join(record.lines()) for record in records), encoding="utf-8")
+
+
+def write_docx(path: Path, records: List[ServiceRecord]) -> None:
+    from docx import Document
+
+    document = Document()
+    for record in records:
+        for line in record.lines():
+            document.add_paragraph(line)
+        document.add_paragraph("")
+    document.save(str(path))
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, records: List[ServiceRecord], records_per_page: int = 5) -> None:
+    """A plain-text PDF written by hand (Helvetica, one text line per record field).
+
+    The upper-case ``ID:`` line of each record is what the PDF ingester
+    treats as a section boundary, as with the real catalogue.
+    """
+    pages = [records[i:i + records_per_page] for i in range(0, len(records), records_per_page)] or [[]]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page_records in pages:
+        lines = []
+        for record in page_records:
+            lines.extend(record.lines())
+        # The ingester stores a section when the next heading starts, so a
+        # trailing heading keeps the last record of the page
+        lines.append("END OF PAGE")
+        text_ops = "\n".join(f"({_pdf_escape(line)}) Tj T*" for line in lines)
+        content = f"BT /F1 9 Tf 11 TL 40 800 Td\n{text_ops}\nET".encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+
+WRITERS = {".txt": write_txt, ".pdf": write_pdf, ".docx": write_docx}
+
+
+def generate_corpus(directory: Path, formats: List[str], documents: int, records_per_document: int, seed: int = 0) -> List[Path]:
+    """Write ``documents`` files per format into ``directory`` and return their paths"""
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for extension in formats:
+        for i in range(documents):
+            records = make_records(records_per_document, seed=seed + i)
+            path = directory / f"corpus_{i:04d}{extension}"
+            WRITERS[extension](path, records)
+            paths.append(path)
+    return paths
@@ -0,0 +1,289 @@
+"""End-to-end benchmark of ingestion and chat through the API.
+
+Generates synthetic TXT and PDF corpora (DOCX with --formats), drives server:app in-process
+(httpx ASGITransport, lifespan included) with the local stand-in backends
+(in-memory vector store, hashing embeddings, echo LLM) and writes the
+results as JSON. Run from the backend_rag directory:
+
+    python -m benchmarks.e2e --documents 20 --records 50 --queries 200 --output e2e.json
+    python -m benchmarks.e2e --output e2e-new.json --baseline e2e.json
+
+Measures upload throughput, ingested chunks/s, preview zone and preview
+image render time, chat p50/p95/p99 latency (with per-stage server timings)
+and peak RSS. With --baseline, prints the relative change of every metric.
+
+An upload that is accepted but yields no chunks counts as an error, not
+towards files/s. process_document has no DOCX branch yet, so DOCX is left
+out by default; with --formats txt pdf docx every DOCX upload shows up as
+an error.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.common import latency_stats, peak_rss_mb, use_local_backends
+from benchmarks.corpus import generate_corpus, make_records
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+async def bench_uploads(client, paths: List[Path]) -> Dict[str, Any]:
+    """Upload every file through POST /api/files, one at a time (uploads yielding no chunks are errors)"""
+    by_format = defaultdict(lambda: {"files": 0, "errors": 0, "bytes": 0, "chunks": 0, "latencies": []})
+    document_ids = []
+    errors = 0
+    start = time.perf_counter()
+    for path in paths:
+        stats = by_format[path.suffix.lstrip(".")]
+        upload_start = time.perf_counter()
+        # process_document prints every chunk; keep that off the terminal
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), open(path, "rb") as f:
+            response = await client.post("/api/files", files={"file": (path.name, f)})
+        stats["latencies"].append((time.perf_counter() - upload_start) * 1000)
+        document = response.json()["document"] if response.status_code == 200 else None
+        if document is None or not document["chunkCount"]:
+            errors += 1
+            stats["errors"] += 1
+            continue
+        document_ids.append(document["id"])
+        stats["files"] += 1
+        stats["bytes"] += path.stat().st_size
+        stats["chunks"] += document["chunkCount"]
+    elapsed = time.perf_counter() - start
+
+    formats = {}
+    for name, stats in by_format.items():
+        seconds = sum(stats["latencies"]) / 1000
+        formats[name] = {
+            "files": stats["files"],
+            "errors": stats["errors"],
+            "chunks": stats["chunks"],
+            "files_per_s": stats["files"] / seconds if seconds else 0.0,
+            "mib_per_s": stats["bytes"] / 2**20 / seconds if seconds else 0.0,
+            "chunks_per_s": stats["chunks"] / seconds if seconds else 0.0,
+            "latency": latency_stats(stats["latencies"]),
+        }
+    total_chunks = sum(stats["chunks"] for stats in by_format.values())
+    return {
+        "files": len(document_ids),
+        "errors": errors,
+        "seconds": elapsed,
+        "files_per_s": len(document_ids) / elapsed if elapsed else 0.0,
+        "chunks": total_chunks,
+        "chunks_per_s": total_chunks / elapsed if elapsed else 0.0,
+        "formats": formats,
+        "document_ids": document_ids,
+    }
+
+
+async def bench_preview_zones(client, document_ids: List[str]) -> Dict[str, Any]:
+    """Time GET /api/documents/{id}/preview for every uploaded document"""
+    latencies = []
+    for document_id in document_ids:
+        start = time.perf_counter()
+        await client.get(f"/api/documents/{document_id}/preview")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latency_stats(latencies) if latencies else {}
+
+
+def bench_preview_render(paths: List[Path]) -> Dict[str, Any]:
+    """Time PDF page image rendering with FileProcessor (needs poppler for pdf2image)"""
+    from utils.file_processing import FileProcessor
+
+    processor = FileProcessor()
+    latencies, pages = [], 0
+    for i, path in enumerate(paths):
+        start = time.perf_counter()
+        try:
+            result = processor.process_file(path, f"bench-render-{i}")
+        except Exception as e:
+            return {"error": str(e)}
+        latencies.append((time.perf_counter() - start) * 1000)
+        pages += result.get("page_count", 0)
+    if not latencies:
+        return {}
+    return {**latency_stats(latencies), "pages_per_s": pages / (sum(latencies) / 1000)}
+
+
+def make_queries(count: int, documents: int, records: int, fast_path_ratio: float, seed: int) -> List[str]:
+    """Questions about the corpus records; a share of them name a service ID (fast path)"""
+    rng = random.Random(seed)
+    catalogue = [record for i in range(documents) for record in make_records(records, seed=seed + i)]
+    queries = []
+    for _ in range(count):
+        record = rng.choice(catalogue)
+        if rng.random() < fast_path_ratio:
+            queries.append(f"What is {record.service_id}?")
+        else:
+            words = record.description.split()
+            start = rng.randrange(max(1, len(words) - 6))
+            queries.append(f"How do I get {' '.join(words[start:start + 6]).lower()}?")
+    return queries
+
+
+async def bench_chat(client, queries: List[str], concurrency: int) -> Dict[str, Any]:
+    """Send the queries to POST /api/chat with ``concurrency`` requests in flight"""
+    from utils.rag_app_weav import NO_ANSWER_MESSAGE
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, stages = [], defaultdict(list)
+    outcomes = defaultdict(int)
+
+    async def ask(query: str) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/api/chat", json={"message": query})
+            latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            outcomes["errors"] += 1
+            return
+        body = response.json()
+        outcomes["no_answer" if body["answer"] == NO_ANSWER_MESSAGE else "answered"] += 1
+        for name, value in (body.get("timings") or {}).items():
+            stages[name].append(value)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(ask(query) for query in queries))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(queries),
+        "concurrency": concurrency,
+        "requests_per_s": len(queries) / elapsed if elapsed else 0.0,
+        **dict(outcomes),
+        "latency": latency_stats(latencies),
+        "stages": {name: latency_stats(values) for name, values in sorted(stages.items())},
+    }
+
+
+async def run(args: argparse.Namespace, workdir: Path) -> Dict[str, Any]:
+    formats = [f".{name.lstrip('.')}" for name in args.formats]
+    paths = generate_corpus(workdir / "corpus", formats, args.documents, args.records, args.seed)
+    rss = {"start": peak_rss_mb()}
+
+    import server
+    # Keep per-request INFO logs out of the measurements
+    logging.getLogger().setLevel(logging.WARNING)
+    rss["after_import"] = peak_rss_mb()
+
+    async with server.lifespan(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            ingest = await bench_uploads(client, paths)
+            rss["after_ingest"] = peak_rss_mb()
+            preview_zones = await bench_preview_zones(client, ingest.pop("document_ids"))
+
+            queries = make_queries(args.queries + args.warmup, args.documents, args.records, args.fast_path_ratio, args.seed)
+            await bench_chat(client, queries[:args.warmup], args.concurrency)
+            chat = await bench_chat(client, queries[args.warmup:], args.concurrency)
+            rss["after_chat"] = peak_rss_mb()
+
+    preview_render = bench_preview_render([path for path in paths if path.suffix == ".pdf"]) if args.render_previews else {}
+    rss["peak"] = peak_rss_mb()
+    return {
+        "ingest": ingest,
+        "preview_zones": preview_zones,
+        "preview_render": preview_render,
+        "chat": chat,
+        "peak_rss_mb": rss,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves of nested dicts, keyed by their dotted path"""
+    if isinstance(data, bool):
+        return {}
+    if isinstance(data, (int, float)):
+        return {prefix: data}
+    if isinstance(data, dict):
+        flat = {}
+        for key, value in data.items():
+            flat.update(flatten(value, f"{prefix}.{key}" if prefix else key))
+        return flat
+    return {}
+
+
+def compare(baseline: Dict[str, Any], results: Dict[str, Any]) -> None:
+    """Print the relative change of every metric present in both runs"""
+    old, new = flatten(baseline["results"]), flatten(results["results"])
+    print(f"Change against {baseline.get('git_commit') or 'baseline'} ({baseline.get('timestamp')}):", file=sys.stderr)
+    for key in sorted(old.keys() & new.keys()):
+        change = f"{(new[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else "n/a"
+        print(f"  {key}: {old[key]:.2f} -> {new[key]:.2f} ({change})", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", nargs="+", default=["txt", "pdf"])
+    parser.add_argument("--documents", type=int, default=10, help="documents per format")
+    parser.add_argument("--records", type=int, default=40, help="service records per document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--fast-path-ratio", type=float, default=0.2, help="share of queries naming a service ID")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="echo LLM latency before the answer")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="echo LLM latency per token")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the semantic answer cache enabled")
+    parser.add_argument("--no-render-previews", dest="render_previews", action="store_false")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="directory for the corpus, uploads and previews (default: a new temp dir)")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="rag-e2e-")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    output = Path(args.output).resolve() if args.output else None
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+
+    use_local_backends(args.llm_latency_ms, args.token_latency_ms)
+    os.environ["ANSWER_CACHE_ENABLED"] = "true" if args.answer_cache else "false"
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    os.environ["TQDM_DISABLE"] = "1"
+    # The server keeps uploads and previews relative to the working directory
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.chdir(workdir)
+
+    results = {
+        "benchmark": "e2e",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": asyncio.run(run(args, workdir)),
+    }
+
+    report = json.dumps(results, indent=2)
+    if output is not None:
+        output.write_text(report)
+        print(f"Results written to {output}", file=sys.stderr)
+    else:
+        print(report)
+    if baseline is not None:
+        compare(baseline, results)
+
+
+if __name__ == "__main__":
+    main()
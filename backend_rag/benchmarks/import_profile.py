@@ -0,0 +1,89 @@
+"""Profile the import-time cost of the API modules.
+
+Run from the backend_rag directory:
+
+    python -m benchmarks.import_profile --module server --top 25
+
+Each run imports the module in a fresh interpreter with ``python -X importtime``
+and reports the total cost, the slowest modules (cumulative, including their
+own imports) and the cost per top-level package.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+
+def import_times(module: str) -> List[Dict]:
+    """Import ``module`` in a fresh interpreter and parse the -X importtime report"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # "import time: <self us> | <cumulative us> | <indented module name>"
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        entries.append({
+            "module": name.strip(),
+            "depth": depth,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return entries
+
+
+def summarize(entries: List[Dict], top: int) -> Dict:
+    """Total cost, slowest modules and per-package cost of one import"""
+    total_ms = max(entry["cumulative_ms"] for entry in entries)
+    packages = defaultdict(float)
+    for entry in entries:
+        packages[entry["module"].split(".")[0]] += entry["self_ms"]
+    return {
+        "total_ms": total_ms,
+        "modules": len(entries),
+        "slowest": sorted(entries, key=lambda entry: entry["cumulative_ms"], reverse=True)[:top],
+        "packages": dict(sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    runs = [summarize(import_times(args.module), args.top) for _ in range(args.repeat)]
+    report = runs[-1]
+    report["module"] = args.module
+    report["total_ms_runs"] = [run["total_ms"] for run in runs]
+    report["total_ms_median"] = statistics.median(report["total_ms_runs"])
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"import {args.module}: median {report['total_ms_median']:.1f} ms over {args.repeat} runs, {report['modules']} modules")
+    print("\nSlowest modules (cumulative ms, self ms):")
+    for entry in report["slowest"]:
+        print(f"  {entry['cumulative_ms']:9.1f} {entry['self_ms']:9.1f}  {'  ' * entry['depth']}{entry['module']}")
+    print("\nSelf time per top-level package (ms):")
+    for package, self_ms in report["packages"].items():
+        print(f"  {self_ms:9.1f}  {package}")
+
+
+if __name__ == "__main__":
+    main()
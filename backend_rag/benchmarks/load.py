@@ -0,0 +1,341 @@
+"""Concurrent mixed-traffic load generator for the API.
+
+Sends a weighted mix of chat, streaming chat, search, preview, document list
+and upload requests, either open-loop (Poisson arrivals at --rate requests/s)
+or closed-loop (--concurrency workers back to back), and reports
+throughput, latency percentiles and error rates per endpoint, overall and per
+time window. Run from the backend_rag directory:
+
+    python -m benchmarks.load --duration 30 --rate 50 --mix chat=6,search=2,preview=1,upload=1
+    python -m benchmarks.load --url http://localhost:8000 --concurrency 16 --duration 60
+
+Without --url, server:app runs in-process with the local stand-in backends,
+and an event-loop lag probe shows when a handler blocks the loop (e.g. a
+synchronous upload stalling every concurrent chat). --max-p99-ms and
+--max-error-rate make the run exit non-zero, so it can guard against
+regressions.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.common import latency_stats, peak_rss_mb, use_local_backends
+from benchmarks.corpus import generate_corpus, make_records, write_txt
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_MIX = "chat=5,stream=1,search=2,preview=1,documents=1,upload=1"
+
+
+class LoadContext:
+    """Shared state of a load run: the client, known documents and query pool"""
+
+    def __init__(self, client: httpx.AsyncClient, workdir: Path, queries: List[str], seed: int):
+        self.client = client
+        self.workdir = workdir
+        self.queries = queries
+        self.document_ids: List[str] = []
+        self.rng = random.Random(seed)
+        self.uploads = 0
+
+
+async def do_chat(ctx: LoadContext) -> httpx.Response:
+    return await ctx.client.post("/api/chat", json={"message": ctx.rng.choice(ctx.queries)})
+
+
+async def do_stream(ctx: LoadContext) -> httpx.Response:
+    async with ctx.client.stream("POST", "/api/chat/stream", json={"message": ctx.rng.choice(ctx.queries)}) as response:
+        async for _ in response.aiter_bytes():
+            pass
+        return response
+
+
+async def do_search(ctx: LoadContext) -> httpx.Response:
+    return await ctx.client.get("/api/search", params={"q": ctx.rng.choice(ctx.queries), "top_k": 10})
+
+
+async def do_preview(ctx: LoadContext) -> httpx.Response:
+    document_id = ctx.rng.choice(ctx.document_ids) if ctx.document_ids else "missing"
+    return await ctx.client.get(f"/api/documents/{document_id}/preview")
+
+
+async def do_documents(ctx: LoadContext) -> httpx.Response:
+    return await ctx.client.get("/api/documents")
+
+
+async def do_upload(ctx: LoadContext) -> httpx.Response:
+    ctx.uploads += 1
+    path = ctx.workdir / f"load_upload_{ctx.uploads:05d}.txt"
+    write_txt(path, make_records(20, seed=10000 + ctx.uploads))
+    with open(path, "rb") as f:
+        response = await ctx.client.post("/api/files", files={"file": (path.name, f.read())})
+    if response.status_code == 200:
+        ctx.document_ids.append(response.json()["document"]["id"])
+    return response
+
+
+ENDPOINTS: Dict[str, Callable[[LoadContext], Awaitable[httpx.Response]]] = {
+    "chat": do_chat,
+    "stream": do_stream,
+    "search": do_search,
+    "preview": do_preview,
+    "documents": do_documents,
+    "upload": do_upload,
+}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parse "chat=5,search=2" into endpoint weights"""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {name!r}, expected one of {', '.join(ENDPOINTS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class Recorder:
+    """Collects (time, endpoint, latency, ok) samples and summarizes them"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.samples: List[Tuple[float, str, float, bool, str]] = []
+        self.loop_lag: List[Tuple[float, float]] = []
+
+    def record(self, endpoint: str, started: float, ok: bool, detail: str = "") -> None:
+        now = time.perf_counter()
+        self.samples.append((now - self.start, endpoint, (now - started) * 1000, ok, detail))
+
+    @staticmethod
+    def _summary(samples: List[Tuple[float, str, float, bool, str]], seconds: float) -> Dict[str, Any]:
+        latencies = [latency for _, _, latency, _, _ in samples]
+        errors = sum(1 for sample in samples if not sample[3])
+        summary = {
+            "requests": len(samples),
+            "errors": errors,
+            "error_rate": errors / len(samples) if samples else 0.0,
+            "throughput_rps": len(samples) / seconds if seconds else 0.0,
+        }
+        if latencies:
+            summary["latency"] = latency_stats(latencies)
+        return summary
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        by_endpoint = defaultdict(list)
+        for sample in self.samples:
+            by_endpoint[sample[1]].append(sample)
+        error_details = defaultdict(int)
+        for sample in self.samples:
+            if not sample[3]:
+                error_details[f"{sample[1]}: {sample[4]}"] += 1
+
+        windows = []
+        window_count = int(elapsed // self.interval) + 1
+        for index in range(window_count):
+            low, high = index * self.interval, (index + 1) * self.interval
+            window_samples = [sample for sample in self.samples if low <= sample[0] < high]
+            lags = [lag for at, lag in self.loop_lag if low <= at < high]
+            window_endpoints = defaultdict(list)
+            for sample in window_samples:
+                window_endpoints[sample[1]].append(sample)
+            windows.append({
+                "start_s": low,
+                "endpoints": {
+                    name: self._summary(samples, self.interval) for name, samples in sorted(window_endpoints.items())
+                },
+                "loop_lag_max_ms": max(lags) if lags else None,
+            })
+
+        lags = [lag for _, lag in self.loop_lag]
+        return {
+            "duration_s": elapsed,
+            "overall": self._summary(self.samples, elapsed),
+            "endpoints": {name: self._summary(samples, elapsed) for name, samples in sorted(by_endpoint.items())},
+            "errors": dict(error_details),
+            "loop_lag_ms": latency_stats(lags) if lags else None,
+            "windows": windows,
+        }
+
+
+async def send(ctx: LoadContext, recorder: Recorder, endpoint: str, timeout: float) -> None:
+    started = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(ENDPOINTS[endpoint](ctx), timeout)
+        ok = response.status_code < 400
+        recorder.record(endpoint, started, ok, "" if ok else f"HTTP {response.status_code}")
+    except asyncio.TimeoutError:
+        recorder.record(endpoint, started, False, "timeout")
+    except Exception as e:
+        recorder.record(endpoint, started, False, type(e).__name__)
+
+
+async def probe_loop_lag(recorder: Recorder, period: float = 0.01) -> None:
+    """Measure how late a short sleep wakes up; large values mean a handler blocked the loop"""
+    while True:
+        before = time.perf_counter()
+        await asyncio.sleep(period)
+        recorder.loop_lag.append((time.perf_counter() - recorder.start, (time.perf_counter() - before - period) * 1000))
+
+
+async def drive(ctx: LoadContext, recorder: Recorder, args: argparse.Namespace, weights: Dict[str, float]) -> float:
+    """Generate load for the configured duration; returns the elapsed seconds"""
+    names, values = list(weights), list(weights.values())
+    deadline = time.perf_counter() + args.duration
+    tasks = set()
+
+    if args.rate > 0:
+        # Open loop: Poisson arrivals, independent of how fast responses come back
+        limit = asyncio.Semaphore(args.max_in_flight)
+
+        async def bounded(endpoint: str) -> None:
+            async with limit:
+                await send(ctx, recorder, endpoint, args.timeout)
+
+        next_arrival = time.perf_counter()
+        while next_arrival < deadline:
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            task = asyncio.create_task(bounded(ctx.rng.choices(names, values)[0]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_arrival += ctx.rng.expovariate(args.rate)
+    else:
+        # Closed loop: each worker sends its next request when the previous one finishes
+        async def worker() -> None:
+            while time.perf_counter() < deadline:
+                await send(ctx, recorder, ctx.rng.choices(names, values)[0], args.timeout)
+
+        tasks = {asyncio.create_task(worker()) for _ in range(args.concurrency)}
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    return time.perf_counter() - recorder.start
+
+
+async def run(args: argparse.Namespace, workdir: Path) -> Dict[str, Any]:
+    weights = parse_mix(args.mix)
+    corpus = generate_corpus(workdir / "corpus", [".txt", ".pdf"], args.documents, args.records, args.seed)
+    queries = []
+    for i in range(args.documents):
+        for record in make_records(args.records, seed=args.seed + i):
+            queries.append(" ".join(record.description.split()[:6]).lower())
+            queries.append(f"What is {record.service_id}?")
+
+    async with contextlib.AsyncExitStack() as stack:
+        if args.url:
+            client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        else:
+            import server
+            logging.getLogger().setLevel(logging.WARNING)
+            await stack.enter_async_context(server.lifespan(server.app))
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://load", timeout=args.timeout)
+        await stack.enter_async_context(client)
+
+        ctx = LoadContext(client, workdir, queries, args.seed)
+        # Seed the catalogue so chats, searches and previews have something to hit
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for path in corpus:
+                with open(path, "rb") as f:
+                    response = await client.post("/api/files", files={"file": (path.name, f.read())})
+                response.raise_for_status()
+                ctx.document_ids.append(response.json()["document"]["id"])
+
+            recorder = Recorder(args.interval)
+            probe = asyncio.create_task(probe_loop_lag(recorder)) if not args.url else None
+            try:
+                elapsed = await drive(ctx, recorder, args, weights)
+            finally:
+                if probe is not None:
+                    probe.cancel()
+
+    report = recorder.report(elapsed)
+    report["peak_rss_mb"] = peak_rss_mb() if not args.url else None
+    return report
+
+
+def check_thresholds(report: Dict[str, Any], max_p99_ms: Optional[float], max_error_rate: Optional[float]) -> List[str]:
+    """Endpoint results that break the configured limits"""
+    failures = []
+    for name, summary in report["endpoints"].items():
+        p99 = summary.get("latency", {}).get("p99_ms")
+        if max_p99_ms is not None and p99 is not None and p99 > max_p99_ms:
+            failures.append(f"{name}: p99 {p99:.1f} ms > {max_p99_ms} ms")
+        if max_error_rate is not None and summary["error_rate"] > max_error_rate:
+            failures.append(f"{name}: error rate {summary['error_rate']:.3f} > {max_error_rate}")
+    return failures
+
+
+def print_summary(report: Dict[str, Any]) -> None:
+    print(f"{'endpoint':<10} {'requests':>8} {'rps':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}", file=sys.stderr)
+    for name, summary in report["endpoints"].items():
+        latency = summary.get("latency", {})
+        print(
+            f"{name:<10} {summary['requests']:>8} {summary['throughput_rps']:>8.1f} {summary['errors']:>7} "
+            f"{latency.get('p50_ms', 0):>9.1f} {latency.get('p95_ms', 0):>9.1f} {latency.get('p99_ms', 0):>9.1f}",
+            file=sys.stderr
+        )
+    if report["loop_lag_ms"]:
+        lag = report["loop_lag_ms"]
+        print(f"event loop lag: p99 {lag['p99_ms']:.1f} ms, max {lag['max_ms']:.1f} ms", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running server (default: run server:app in-process)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"endpoint weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--rate", type=float, default=0.0, help="open-loop arrival rate in requests/s (0: closed loop)")
+    parser.add_argument("--concurrency", type=int, default=8, help="closed-loop workers")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="open-loop cap on outstanding requests")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--interval", type=float, default=1.0, help="time-series window in seconds")
+    parser.add_argument("--documents", type=int, default=5, help="seed documents per format")
+    parser.add_argument("--records", type=int, default=20, help="service records per seed document")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="echo LLM latency (in-process only)")
+    parser.add_argument("--token-latency-ms", type=float, default=5.0, help="echo LLM per-token latency (in-process only)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--max-p99-ms", type=float, help="fail when any endpoint's p99 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, help="fail when any endpoint's error rate exceeds this")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag-load-")).resolve()
+    output = Path(args.output).resolve() if args.output else None
+    if not args.url:
+        use_local_backends(args.llm_latency_ms, args.token_latency_ms)
+        os.environ["TQDM_DISABLE"] = "1"
+        sys.path.insert(0, str(BACKEND_DIR))
+        os.chdir(workdir)
+
+    report = asyncio.run(run(args, workdir))
+    report["config"] = {key: value for key, value in vars(args).items() if key != "output"}
+
+    text = json.dumps(report, indent=2)
+    if output is not None:
+        output.write_text(text)
+        print(f"Report written to {output}", file=sys.stderr)
+    else:
+        print(text)
+    print_summary(report)
+
+    failures = check_thresholds(report, args.max_p99_ms, args.max_error_rate)
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
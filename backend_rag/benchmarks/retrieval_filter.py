@@ -0,0 +1,56 @@
+"""Benchmark retrieval latency with and without a document_id filter.
+
+Run from the backend_rag directory against the configured Weaviate cluster:
+
+    python -m benchmarks.retrieval_filter --document-id <id> --queries "renew passport" "opening hours"
+"""
+import argparse
+import json
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.common import latency_stats
+from utils.rag_app_weav import RAGProcessor
+
+
+def time_retrieval(rag_processor: RAGProcessor, queries: List[str], repeat: int, document_id: Optional[str]) -> Dict[str, float]:
+    """Time retrieve() for every query, returning latency stats in milliseconds"""
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            rag_processor.retrieve(query, document_id=document_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    return latency_stats(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--document-id", required=True, help="Document to scope the filtered run to")
+    parser.add_argument("--queries", nargs="+", required=True)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    args = parser.parse_args()
+
+    rag_processor = RAGProcessor()
+    rag_processor.connect()
+    try:
+        corpus_size = rag_processor.vector_store.count()
+
+        # Warm up connections and server-side caches before measuring
+        time_retrieval(rag_processor, args.queries, args.warmup, None)
+        time_retrieval(rag_processor, args.queries, args.warmup, args.document_id)
+
+        results = {
+            "corpus_chunks": corpus_size,
+            "unfiltered": time_retrieval(rag_processor, args.queries, args.repeat, None),
+            "filtered": time_retrieval(rag_processor, args.queries, args.repeat, args.document_id),
+        }
+        print(json.dumps(results, indent=2))
+    finally:
+        rag_processor.cleanup()
+
+
+if __name__ == "__main__":
+    main()
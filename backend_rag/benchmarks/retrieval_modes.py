@@ -0,0 +1,56 @@
+"""Benchmark vector-only against hybrid (BM25 + vector, rank-fused) retrieval.
+
+Run from the backend_rag directory against the configured Weaviate cluster:
+
+    python -m benchmarks.retrieval_modes --queries "renew passport" "SRV-1042"
+
+The query embedding cache is disabled so that both modes pay for embedding.
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+
+from benchmarks.common import latency_stats
+from utils.rag_app_weav import RAGProcessor
+
+
+def time_mode(rag_processor: RAGProcessor, queries: List[str], repeat: int, mode: str) -> Dict[str, float]:
+    """Time retrieve() in the given mode, returning latency stats in milliseconds"""
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            rag_processor.retrieve(query, mode=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latency_stats(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", nargs="+", required=True)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    args = parser.parse_args()
+
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+    rag_processor = RAGProcessor()
+    rag_processor.connect()
+    try:
+        for mode in ("vector", "hybrid"):
+            time_mode(rag_processor, args.queries, args.warmup, mode)
+
+        results = {
+            "hybrid_alpha": rag_processor.hybrid_alpha,
+            "rrf_k": rag_processor.rrf_k,
+            "vector": time_mode(rag_processor, args.queries, args.repeat, "vector"),
+            "hybrid": time_mode(rag_processor, args.queries, args.repeat, "hybrid"),
+        }
+        print(json.dumps(results, indent=2))
+    finally:
+        rag_processor.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Throughput scaling of serve.py with the number of worker processes.
+
+For every worker count, starts serve.py with the local stand-in backends in
+a fresh working directory, runs the closed-loop load generator against it
+(benchmarks.load --url) and stops it with SIGTERM. Reports requests/s,
+latency percentiles and the speedup over the first worker count. Run from
+the backend_rag directory:
+
+    python -m benchmarks.scaling --workers 1 2 4 --concurrency 32 --duration 30
+
+The echo LLM latency makes chats I/O-bound like the real API; set
+--llm-latency-ms 0 to measure the CPU-bound part of the request path (the
+workers then compete for cores with each other and with the load
+generator). Uploads are left out of the default mix: with the in-memory
+vector store every worker re-ingests each uploaded document.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.common import use_local_backends
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_MIX = "chat=5,stream=1,search=2,preview=1,documents=1"
+
+
+def wait_until_healthy(url: str, server: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py exited with code {server.returncode}")
+        try:
+            if httpx.get(f"{url}/api/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} not healthy after {timeout}s")
+
+
+def run_workers(workers: int, args: argparse.Namespace, workdir: Path) -> Dict[str, Any]:
+    """Start serve.py with ``workers`` processes, load it and return the load report"""
+    rundir = workdir / f"workers-{workers}"
+    rundir.mkdir(parents=True, exist_ok=True)
+    url = f"http://127.0.0.1:{args.port}"
+    env = {**os.environ, "SHARED_STATE_POLL_INTERVAL": "0.2"}
+    with open(rundir / "server.log", "w") as log:
+        server = subprocess.Popen(
+            [sys.executable, str(BACKEND_DIR / "serve.py"), "--workers", str(workers), "--host", "127.0.0.1",
+             "--port", str(args.port), "--log-level", "warning"],
+            cwd=rundir, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        try:
+            wait_until_healthy(url, server, args.startup_timeout)
+            report_path = rundir / "load.json"
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.load", "--url", url, "--concurrency", str(args.concurrency),
+                 "--duration", str(args.duration), "--mix", args.mix, "--documents", str(args.documents),
+                 "--records", str(args.records), "--output", str(report_path)],
+                cwd=BACKEND_DIR, check=False
+            )
+            return json.loads(report_path.read_text())
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+
+def summarize(worker_counts: List[int], reports: Dict[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    rows = []
+    base = reports[worker_counts[0]]["overall"]["throughput_rps"]
+    for workers in worker_counts:
+        overall = reports[workers]["overall"]
+        latency = overall.get("latency", {})
+        rows.append({
+            "workers": workers,
+            "throughput_rps": overall["throughput_rps"],
+            "speedup": overall["throughput_rps"] / base if base else 0.0,
+            "error_rate": overall["error_rate"],
+            "p50_ms": latency.get("p50_ms"),
+            "p99_ms": latency.get("p99_ms"),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=32, help="closed-loop load workers")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load per worker count")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--documents", type=int, default=5, help="seed documents per format")
+    parser.add_argument("--records", type=int, default=20, help="service records per seed document")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--token-latency-ms", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    # Inherited by serve.py and its workers
+    use_local_backends(args.llm_latency_ms, args.token_latency_ms)
+    os.environ["TQDM_DISABLE"] = "1"
+    workdir = Path(tempfile.mkdtemp(prefix="rag-scaling-")).resolve()
+
+    reports = {workers: run_workers(workers, args, workdir) for workers in args.workers}
+    results = {
+        "benchmark": "scaling",
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": summarize(args.workers, reports),
+        "reports": reports,
+    }
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    print(f"{'workers':>7} {'rps':>8} {'speedup':>8} {'p50 ms':>9} {'p99 ms':>9}", file=sys.stderr)
+    for row in results["results"]:
+        print(
+            f"{row['workers']:>7} {row['throughput_rps']:>8.1f} {row['speedup']:>8.2f} "
+            f"{row['p50_ms'] or 0:>9.1f} {row['p99_ms'] or 0:>9.1f}",
+            file=sys.stderr
+        )
+
+
+if __name__ == "__main__":
+    main()
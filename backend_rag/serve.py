@@ -0,0 +1,78 @@
+"""Production entry point: server:app in several uvicorn worker processes.
+
+    python serve.py --workers 4 --port 8000
+
+Each worker imports the app and runs its lifespan on its own, so the
+vector store, LLM and SQLite connections are opened after the worker
+starts, never inherited across a fork. State the workers must agree on
+(document catalog, document change log, conversation sessions, query
+embedding cache, Prometheus metrics) lives in files under data/ shared by
+all of them. On SIGTERM/SIGINT workers stop accepting connections and get
+--graceful-timeout seconds to finish in-flight requests.
+
+Chat admission control runs in each worker, so CHAT_MAX_CONCURRENT and
+CHAT_MAX_QUEUE are taken as limits for the whole server and divided
+(rounded up) among the workers before they start.
+"""
+from dotenv import load_dotenv
+from pathlib import Path
+import argparse
+import logging
+import math
+import os
+import shutil
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def configure_shared_state(data_dir: Path) -> None:
+    """Default the worker-shared stores to files under ``data_dir`` (explicit env vars win)"""
+    os.environ.setdefault("SHARED_STATE_PATH", str(data_dir / "shared_state.sqlite3"))
+    os.environ.setdefault("EMBEDDING_CACHE_PATH", str(data_dir / "query_embeddings.sqlite3"))
+    metrics_dir = Path(os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", str(data_dir / "prometheus")))
+    # Samples of a previous run would be aggregated with the new workers' ones
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+
+
+def split_admission_limits(workers: int) -> None:
+    """Turn the server-wide chat admission limits into per-worker ones for ``workers`` processes"""
+    # Defaults as in RAGProcessor; 0 (no limit / no queue) stays 0
+    for name, default in (("CHAT_MAX_CONCURRENT", "32"), ("CHAT_MAX_QUEUE", "128")):
+        total = int(os.getenv(name, default))
+        os.environ[name] = str(math.ceil(total / workers))
+        logger.info(f"{name}={total} for the server: {os.environ[name]} per worker")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--graceful-timeout", type=float, default=30.0, help="seconds to finish in-flight requests on shutdown")
+    parser.add_argument("--data-dir", default="data", help="directory of the stores shared by the workers")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    configure_shared_state(Path(args.data_dir))
+    split_admission_limits(max(1, args.workers))
+    if os.getenv("VECTOR_STORE_BACKEND") == "memory" and args.workers > 1:
+        logger.warning("VECTOR_STORE_BACKEND=memory: every worker keeps (and re-ingests) its own copy of the documents")
+
+    import uvicorn
+    logger.info(f"Starting {args.workers} workers on {args.host}:{args.port}")
+    uvicorn.run(
+        "server:app",
+        app_dir=str(Path(__file__).resolve().parent),
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,31 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router
+from utils.metrics import PrometheusMiddleware, mark_worker_dead, register_stats_collector
+from utils.rag_app_weav import RAGProcessor
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared RAG components once and release them on shutdown"""
+    rag_processor = RAGProcessor()
+    rag_processor.connect()
+    app.state.rag_processor = rag_processor
+    register_stats_collector(rag_processor.stats)
+    logger.info("Shared RAG components ready")
+    try:
+        yield
+    finally:
+        rag_processor.cleanup()
+        mark_worker_dead()
+
 def create_app() -> FastAPI:
-    app = FastAPI(title="RAG API", version="1.0.0")
+    app = FastAPI(title="RAG API", version="1.0.0", lifespan=lifespan)
 
     # Configure CORS
     app.add_middleware(
@@ -19,6 +36,9 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    # Request latency histograms and in-flight gauges, exported on /api/metrics
+    app.add_middleware(PrometheusMiddleware)
+
     # Include all routes from routes.py
     app.include_router(router)
 
@@ -27,10 +47,11 @@ def create_app() -> FastAPI:
 app = create_app()
 
 if __name__ == "__main__":
+    # Development server; use serve.py to run several worker processes
     import uvicorn
     uvicorn.run(
         "server:app",
         host="0.0.0.0",
         port=8000,
         reload=True
-    ) 
\ No newline at end of file
+    ) 
@@ -0,0 +1,152 @@
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+import asyncio
+import logging
+import time
+
+from utils.metrics import ADMISSION, ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot start soon enough and should be retried later"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Server busy ({reason}), retry in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """A slot held by one request; release() is idempotent"""
+
+    def __init__(self, controller: "AdmissionController"):
+        self.controller = controller
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """Caps the number of concurrent requests; excess requests wait in a bounded queue.
+
+    Up to ``max_concurrent`` requests run at once (0 disables the limit).
+    Others wait, at most ``max_queue`` of them and for at most
+    ``queue_timeout`` seconds, then get AdmissionRejected so the client backs
+    off instead of adding to the pile. With ``fair`` the waiting requests
+    are queued per client and freed slots go round-robin across clients, so
+    one heavy client cannot starve the others. Must be used from a single
+    event loop.
+    """
+
+    def __init__(self, max_concurrent: int = 32, max_queue: int = 128, queue_timeout: float = 10.0, fair: bool = False):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.fair = fair
+        self.active = 0
+        self.waiting = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # Moving average of how long a request holds its slot, for Retry-After
+        self._service_time = 1.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def _retry_after(self) -> float:
+        """Rough time until the queue ahead of a new request has drained"""
+        return max(1.0, self._service_time * (self.waiting + 1) / max(1, self.max_concurrent))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self.rejected += 1
+        ADMISSION.labels(outcome=f"rejected_{reason.replace(' ', '_')}").inc()
+        return AdmissionRejected(reason, self._retry_after())
+
+    def _set_gauges(self) -> None:
+        ADMISSION_ACTIVE.set(self.active)
+        ADMISSION_QUEUE_DEPTH.set(self.waiting)
+
+    async def acquire(self, client_id: str = "", timeout: Optional[float] = None) -> AdmissionTicket:
+        """Wait for a slot; raises AdmissionRejected when the queue is full or the wait times out.
+
+        ``timeout`` (e.g. the request's remaining time budget) shortens the
+        wait below ``queue_timeout``.
+        """
+        if self.max_concurrent <= 0:
+            return AdmissionTicket(self)
+        if self.active < self.max_concurrent and not self.waiting:
+            self.active += 1
+            self.admitted += 1
+            ADMISSION.labels(outcome="admitted").inc()
+            self._set_gauges()
+            return AdmissionTicket(self)
+        if self.waiting >= self.max_queue:
+            raise self._reject("queue full")
+
+        key = client_id if self.fair else ""
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(future)
+        self.waiting += 1
+        self.queued += 1
+        ADMISSION.labels(outcome="queued").inc()
+        self._set_gauges()
+        try:
+            # Shield so a timeout does not cancel a slot handed over at the same moment
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout if timeout is None else min(self.queue_timeout, timeout))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if not future.done():
+                self._dequeue(key, future)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                raise self._reject("queue timeout")
+            if isinstance(e, asyncio.CancelledError):
+                # The slot was handed over just as the client went away
+                AdmissionTicket(self).release()
+                raise
+        self.admitted += 1
+        ADMISSION.labels(outcome="admitted").inc()
+        return AdmissionTicket(self)
+
+    def _dequeue(self, key: str, future: asyncio.Future) -> None:
+        queue = self._queues.get(key)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.waiting -= 1
+            if not queue:
+                del self._queues[key]
+        self._set_gauges()
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        if self.max_concurrent <= 0:
+            return
+        self._service_time = 0.9 * self._service_time + 0.1 * (time.monotonic() - ticket.started)
+        # Hand the slot straight to the next waiter, taking clients in turn
+        while self._queues:
+            key, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            self.waiting -= 1
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            if not future.done():
+                future.set_result(None)
+                self._set_gauges()
+                return
+        self.active -= 1
+        self._set_gauges()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "service_time_ms": self._service_time * 1000
+        }
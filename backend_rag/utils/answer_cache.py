@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import itertools
+import logging
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+Scope = Optional[Tuple[str, ...]]
+
+
+def make_scope(document_ids: Optional[Iterable[str]]) -> Scope:
+    """Normalize a document filter into a hashable cache scope (None = whole corpus)"""
+    if not document_ids:
+        return None
+    return tuple(sorted(set(document_ids)))
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    sources: List[Dict[str, Any]]
+    vector: np.ndarray
+    scope: Scope
+    cited_documents: Set[str]
+    latency_ms: float
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class SemanticAnswerCache:
+    """Answer cache keyed by query embedding, matched by cosine similarity.
+
+    Entries are only matched within the same document scope, expire after
+    ``ttl_seconds`` and are evicted least-recently-used once ``max_entries``
+    is reached.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 1000):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved_ms = 0.0
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _expired(self, entry: CachedAnswer, now: float) -> bool:
+        return now - entry.created_at > self.ttl_seconds
+
+    def lookup(self, vector: Sequence[float], document_ids: Optional[Iterable[str]] = None) -> Optional[CachedAnswer]:
+        """Return the most similar cached answer in scope above the threshold"""
+        scope = make_scope(document_ids)
+        query = self._normalize(vector)
+        now = time.monotonic()
+
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if self._expired(e, now)]:
+                del self._entries[key]
+
+            candidates = [(k, e) for k, e in self._entries.items() if e.scope == scope]
+            if candidates:
+                matrix = np.stack([e.vector for _, e in candidates])
+                similarities = matrix @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.latency_saved_ms += entry.latency_ms
+                    logger.info(f"Answer cache hit (similarity {similarities[best]:.3f})")
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        vector: Sequence[float],
+        document_ids: Optional[Iterable[str]],
+        answer: str,
+        sources: List[Dict[str, Any]],
+        cited_documents: Iterable[str],
+        latency_ms: float
+    ) -> None:
+        """Cache an answer together with the documents it was built from"""
+        entry = CachedAnswer(
+            answer=answer,
+            sources=sources,
+            vector=self._normalize(vector),
+            scope=make_scope(document_ids),
+            cited_documents={d for d in cited_documents if d},
+            latency_ms=latency_ms
+        )
+        with self._lock:
+            self._entries[next(self._ids)] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_document(self, document_id: str) -> int:
+        """Drop every entry that cited or was scoped to the document"""
+        with self._lock:
+            stale = [
+                k for k, e in self._entries.items()
+                if document_id in e.cited_documents or (e.scope and document_id in e.scope)
+            ]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            logger.info(f"Invalidated {len(stale)} cached answers for document {document_id}")
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and latency saved since startup"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "latency_saved_ms": round(self.latency_saved_ms, 2)
+            }
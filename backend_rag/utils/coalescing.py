@@ -0,0 +1,91 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+import asyncio
+import logging
+import math
+
+from utils.deadline import Deadline, run_within
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Flight:
+    """One shared computation, its deadline and the number of callers waiting for it"""
+
+    def __init__(self, deadline: Optional[Deadline]):
+        # A copy, so later callers can extend it without touching the first caller's
+        self.deadline = None if deadline is None else Deadline(deadline.remaining())
+        self.task: Optional["asyncio.Task[Any]"] = None
+        self.waiters = 0
+
+    def extend(self, deadline: Optional[Deadline]) -> None:
+        """Let the shared work run until the latest waiter's deadline"""
+        if self.deadline is None:
+            return
+        # A waiter without a deadline waits as long as it takes
+        expires_at = math.inf if deadline is None else deadline.expires_at
+        self.deadline.expires_at = max(self.deadline.expires_at, expires_at)
+
+
+class SingleFlight:
+    """Coalesces concurrent identical async computations into one.
+
+    The first caller for a key starts the computation as a task of its own;
+    callers arriving while it is in flight wait for the same task and
+    receive the same result (or exception). The computation's deadline is
+    extended to the latest deadline of the callers that joined it (a stage
+    already running keeps the budget it started with), while
+    each caller waits only within its own deadline (DeadlineExceeded). A
+    caller that goes away does not cancel the others: the task is cancelled
+    only once nobody waits for it anymore. Nothing is cached once the
+    computation finishes. Must be used from a single event loop.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, _Flight] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Whether a computation for the key is currently running"""
+        return key in self._in_flight
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+
+    async def do(
+        self,
+        key: Hashable,
+        compute: Callable[[Optional[Deadline]], Awaitable[T]],
+        deadline: Optional[Deadline] = None
+    ) -> T:
+        """Run ``compute(shared_deadline)`` once for concurrent callers of the same key"""
+        flight = self._in_flight.get(key)
+        if flight is None:
+            flight = _Flight(deadline)
+            flight.task = asyncio.ensure_future(compute(flight.deadline))
+            self._in_flight[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.executed += 1
+        else:
+            flight.extend(deadline)
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # Shield so one waiter going away does not cancel the shared work
+            return await run_within(deadline, "coalesced", asyncio.shield(flight.task))
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "coalesced": self.coalesced
+        }
@@ -0,0 +1,119 @@
+from typing import Callable, List, Optional, Set, Tuple
+import logging
+import re
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class ContextPacker:
+    """Packs retrieved chunks into a prompt context under a token budget.
+
+    Adjacent sections from the same document page are merged, passages that
+    mostly repeat an already selected passage (chunk overlap, duplicate
+    ingests) are dropped, and the rest are added in retrieval order until
+    ``max_tokens`` is reached.
+    """
+
+    def __init__(self, max_tokens: int = 1500, duplicate_threshold: float = 0.8, model: str = "gpt-3.5-turbo"):
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.model = model
+        self._encoding = None
+        self._count: Optional[Callable[[str], int]] = None
+
+    def _load_tokenizer(self) -> None:
+        try:
+            import tiktoken
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+            self._count = lambda text: len(self._encoding.encode(text))
+        except Exception as e:
+            # Rough estimate when tiktoken (or its encoding files) is unavailable
+            logger.warning(f"tiktoken unavailable, estimating tokens from length: {str(e)}")
+            self._count = lambda text: (len(text) + 3) // 4
+
+    def count_tokens(self, text: str) -> int:
+        if self._count is None:
+            self._load_tokenizer()
+        return self._count(text)
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        if self._encoding is not None:
+            return self._encoding.decode(self._encoding.encode(text)[:max_tokens])
+        return text[:max_tokens * 4]
+
+    @staticmethod
+    def _merge_adjacent(docs: List[Document]) -> List[Document]:
+        """Merge sections from the same page whose line ranges touch or overlap"""
+        merged: List[Document] = []
+        for doc in docs:
+            meta = doc.metadata
+            for existing in merged:
+                other = existing.metadata
+                if (
+                    other.get("document_id") == meta.get("document_id")
+                    and other.get("page") == meta.get("page")
+                    and meta.get("start_line") and other.get("start_line")
+                    and meta["start_line"] <= other["end_line"] + 1
+                    and other["start_line"] <= meta["end_line"] + 1
+                ):
+                    first, second = (existing, doc) if other["start_line"] <= meta["start_line"] else (doc, existing)
+                    existing.page_content = f"{first.page_content}\n{second.page_content}"
+                    other["start_line"] = min(other["start_line"], meta["start_line"])
+                    other["end_line"] = max(other["end_line"], meta["end_line"])
+                    break
+            else:
+                merged.append(Document(page_content=doc.page_content, metadata=dict(meta)))
+        return merged
+
+    def _is_duplicate(self, shingles: Set[Tuple[str, ...]], selected: List[Set[Tuple[str, ...]]]) -> bool:
+        """Whether most of the passage (or of a selected one) is already covered"""
+        if not shingles:
+            return True
+        for other in selected:
+            if not other:
+                continue
+            overlap = len(shingles & other) / min(len(shingles), len(other))
+            if overlap >= self.duplicate_threshold:
+                return True
+        return False
+
+    def pack(self, docs: List[Document]) -> Tuple[str, int, List[Document]]:
+        """Return the packed context, its token count and the passages used"""
+        selected: List[Document] = []
+        selected_shingles: List[Set[Tuple[str, ...]]] = []
+        used_tokens = 0
+
+        for doc in self._merge_adjacent(docs):
+            shingles = _shingles(doc.page_content)
+            if self._is_duplicate(shingles, selected_shingles):
+                continue
+
+            tokens = self.count_tokens(doc.page_content)
+            remaining = self.max_tokens - used_tokens
+            if tokens > remaining:
+                if selected:
+                    continue
+                # Never send an empty context: trim the best passage to the budget
+                doc = Document(page_content=self._truncate(doc.page_content, remaining), metadata=doc.metadata)
+                tokens = self.count_tokens(doc.page_content)
+
+            selected.append(doc)
+            selected_shingles.append(shingles)
+            used_tokens += tokens
+
+        context = "\n\n".join(doc.page_content for doc in selected)
+        return context, used_tokens, selected
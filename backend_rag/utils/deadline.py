@@ -0,0 +1,83 @@
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Optional, TypeVar
+import asyncio
+import time
+
+T = TypeVar("T")
+
+_current_deadline: ContextVar[Optional["Deadline"]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time during ``stage``"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """Point in time by which a request must be answered"""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline of the stage running in this context (set by run_within), if any"""
+    return _current_deadline.get()
+
+
+def _start(deadline: Deadline, awaitable: Awaitable[T]) -> "asyncio.Future[T]":
+    # The task copies the current context, so the stage (and the worker
+    # threads it starts with asyncio.to_thread) can see the deadline
+    token = _current_deadline.set(deadline)
+    try:
+        return asyncio.ensure_future(awaitable)
+    finally:
+        _current_deadline.reset(token)
+
+
+async def run_within(deadline: Optional[Deadline], stage: str, awaitable: Awaitable[T]) -> T:
+    """Await a stage with the remaining budget; raises DeadlineExceeded when it runs out.
+
+    A stage running in a worker thread keeps running after the timeout, but
+    the request no longer waits for it; upstream calls made through
+    utils.resilience are given at most the remaining time.
+    """
+    if deadline is None:
+        return await awaitable
+    if deadline.expired():
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded(stage)
+    try:
+        return await asyncio.wait_for(_start(deadline, awaitable), deadline.remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(stage)
+
+
+async def iterate_within(deadline: Optional[Deadline], stage: str, iterator: AsyncIterator[T]) -> AsyncIterator[T]:
+    """Yield from an async iterator until it ends or the deadline passes (DeadlineExceeded)"""
+    if deadline is None:
+        async for item in iterator:
+            yield item
+        return
+    try:
+        while True:
+            try:
+                item = await run_within(deadline, stage, iterator.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,153 @@
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Normalize query text so trivially different strings share one cache entry"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class QueryEmbeddingCache:
+    """In-process LRU cache of query embeddings keyed by model and normalized text.
+
+    Vectors are stored as float32 arrays and the cache is bounded by the total
+    bytes they occupy. When ``path`` is given, entries are also written to a
+    SQLite file so that several worker processes share them; the file keeps
+    the ``max_shared_entries`` most recently written ones.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, path: Optional[str] = None, max_shared_entries: int = 100000):
+        self.max_bytes = max_bytes
+        self.max_shared_entries = max_shared_entries
+        self._last_prune = 0.0
+        self._entries: "OrderedDict[Tuple[str, str], array]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            self._db = self._open_store(Path(path))
+
+    @staticmethod
+    def _open_store(path: Path) -> Optional[sqlite3.Connection]:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(path), timeout=5, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, key))"
+            )
+            logger.info(f"Sharing query embeddings through {path}")
+            return db
+        except sqlite3.Error as e:
+            logger.error(f"Could not open shared embedding store {path}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _key(model: str, text: str) -> Tuple[str, str]:
+        return model, hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+
+    def _remember(self, key: Tuple[str, str], vector: array) -> None:
+        """Insert into the LRU, evicting the oldest entries beyond the byte budget"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = vector
+        self._bytes += vector.itemsize * len(vector)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.itemsize * len(evicted)
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Return the cached embedding for the query, if any"""
+        key = self._key(model, text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector.tolist()
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT vector FROM query_embeddings WHERE model = ? AND key = ?", key
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"Shared embedding store read failed: {str(e)}")
+                    row = None
+                if row is not None:
+                    vector = array("f")
+                    vector.frombytes(row[0])
+                    self._remember(key, vector)
+                    self.shared_hits += 1
+                    return vector.tolist()
+
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, embedding: Sequence[float]) -> None:
+        """Cache the embedding of a query"""
+        key = self._key(model, text)
+        vector = array("f", embedding)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO query_embeddings (model, key, vector) VALUES (?, ?, ?)",
+                        (*key, vector.tobytes())
+                    )
+                    self._prune()
+                except sqlite3.Error as e:
+                    logger.warning(f"Shared embedding store write failed: {str(e)}")
+
+    def _prune(self) -> None:
+        """Drop the oldest shared entries beyond max_shared_entries, at most once a minute"""
+        now = time.monotonic()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        # INSERT OR REPLACE gives a rewritten entry a new rowid, so rowid order is write order
+        deleted = self._db.execute(
+            "DELETE FROM query_embeddings WHERE rowid IN "
+            "(SELECT rowid FROM query_embeddings ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+            (self.max_shared_entries,)
+        ).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} entries from the shared embedding store")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0
+            }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
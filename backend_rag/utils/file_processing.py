@@ -2,9 +2,6 @@ from pathlib import Path
 import logging
 from typing import Dict, Any, Tuple
 
-from docx import Document  # This is from python-docx
-import PyPDF2
-from pdf2image import convert_from_path
 import os
 import shutil
 
@@ -42,6 +39,9 @@ class FileProcessor:
 
     def _process_pdf(self, file_path: Path, document_id: str) -> Dict[str, Any]:
         """Process PDF file and generate previews"""
+        import PyPDF2
+        from pdf2image import convert_from_path
+
         try:
             # Get page count
             with open(file_path, 'rb') as file:
@@ -76,6 +76,8 @@ class FileProcessor:
 
     def _process_docx(self, file_path: Path, document_id: str) -> Dict[str, Any]:
         """Process DOCX file"""
+        from docx import Document  # This is from python-docx
+
         try:
             doc = Document(file_path)
             return {
@@ -0,0 +1,163 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Returns a document's chunks and vectors, or None when it cannot be loaded
+# completely (e.g. it has more chunks than may be cached)
+ChunkLoader = Callable[[str], Optional[Tuple[List[Dict[str, Any]], List[Sequence[float]]]]]
+
+
+@dataclass
+class _HotDocument:
+    vectors: np.ndarray
+    chunks: List[Dict[str, Any]]
+
+    @property
+    def nbytes(self) -> int:
+        # Vector matrix plus a rough allowance for the chunk texts
+        return self.vectors.nbytes + sum(len(chunk.get("text") or "") for chunk in self.chunks)
+
+
+class HotDocumentCache:
+    """In-process vectors of frequently queried documents, searched with NumPy.
+
+    A document is loaded once it has been the target of ``promote_after``
+    scoped queries. Its chunk vectors are kept normalized in one contiguous
+    float32 matrix so a scoped query is a single matrix-vector product.
+    Documents are evicted least-recently-used beyond ``max_bytes`` and must
+    be invalidated when they are deleted or re-ingested.
+
+    Documents the loader returns partially (None) or without any chunk are
+    remembered as uncacheable, so their scoped queries go to the vector
+    store without loading them again. Query counts and uncacheable entries
+    are kept for at most ``max_tracked`` documents each.
+    """
+
+    def __init__(self, loader: ChunkLoader, max_bytes: int = 256 * 1024 * 1024, promote_after: int = 3, max_tracked: int = 10000):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.promote_after = promote_after
+        self.max_tracked = max_tracked
+        self._documents: "OrderedDict[str, _HotDocument]" = OrderedDict()
+        self._query_counts: "OrderedDict[str, int]" = OrderedDict()
+        self._uncacheable: "OrderedDict[str, None]" = OrderedDict()
+        self._loading: set = set()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _promote(self, document_id: str) -> None:
+        """Load a document's chunks and vectors into memory"""
+        try:
+            start = time.perf_counter()
+            loaded = self.loader(document_id)
+            if loaded is None or not loaded[0]:
+                with self._lock:
+                    if document_id in self._loading:
+                        self._query_counts.pop(document_id, None)
+                        self._track(self._uncacheable, document_id, None)
+                logger.info(f"Not caching document {document_id}: {'incomplete load' if loaded is None else 'no chunks'}")
+                return
+            chunks, vectors = loaded
+            matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1, norms)
+            document = _HotDocument(vectors=matrix, chunks=chunks)
+
+            with self._lock:
+                if document_id not in self._loading:
+                    # Invalidated while loading: the data may already be stale
+                    return
+                self._documents[document_id] = document
+                self._query_counts.pop(document_id, None)
+                self._bytes += document.nbytes
+                while self._bytes > self.max_bytes and len(self._documents) > 1:
+                    evicted_id, evicted = self._documents.popitem(last=False)
+                    self._bytes -= evicted.nbytes
+                    logger.info(f"Evicted hot document {evicted_id}")
+            logger.info(
+                f"Cached hot document {document_id}: {len(chunks)} chunks, "
+                f"{document.nbytes / 1024:.0f} KiB in {(time.perf_counter() - start) * 1000:.0f} ms"
+            )
+        except Exception as e:
+            logger.warning(f"Could not cache hot document {document_id}: {str(e)}")
+        finally:
+            with self._lock:
+                self._loading.discard(document_id)
+
+    def _track(self, entries: "OrderedDict[str, Any]", document_id: str, value: Any) -> None:
+        """Set an entry of a bounded per-document map, dropping the least recently set ones"""
+        entries[document_id] = value
+        entries.move_to_end(document_id)
+        while len(entries) > self.max_tracked:
+            entries.popitem(last=False)
+
+    def search(self, vector: Sequence[float], document_ids: List[str], limit: int) -> Optional[List[Tuple[Dict[str, Any], float]]]:
+        """Top chunks with cosine scores, or None when not every document is cached"""
+        to_load = []
+        with self._lock:
+            for document_id in document_ids:
+                if document_id in self._documents or document_id in self._uncacheable:
+                    continue
+                count = self._query_counts.get(document_id, 0) + 1
+                self._track(self._query_counts, document_id, count)
+                if count >= self.promote_after and document_id not in self._loading:
+                    self._loading.add(document_id)
+                    to_load.append(document_id)
+
+        # The query that crosses the threshold pays for loading and is then served from memory
+        for document_id in to_load:
+            self._promote(document_id)
+
+        with self._lock:
+            documents = [self._documents.get(document_id) for document_id in document_ids]
+            if not all(documents):
+                self.misses += 1
+                return None
+            for document_id in document_ids:
+                self._documents.move_to_end(document_id)
+            self.hits += 1
+
+        query = np.array(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query /= norm
+
+        candidates = []
+        for document in documents:
+            scores = document.vectors @ query
+            top = np.argpartition(-scores, min(limit, len(scores)) - 1)[:limit]
+            candidates.extend((document.chunks[i], float(scores[i])) for i in top)
+        candidates.sort(key=lambda candidate: candidate[1], reverse=True)
+        return candidates[:limit]
+
+    def invalidate(self, document_id: str) -> None:
+        """Forget a document that was deleted or re-ingested"""
+        with self._lock:
+            self._loading.discard(document_id)
+            self._query_counts.pop(document_id, None)
+            self._uncacheable.pop(document_id, None)
+            document = self._documents.pop(document_id, None)
+            if document is not None:
+                self._bytes -= document.nbytes
+                logger.info(f"Invalidated hot document {document_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "documents": len(self._documents),
+                "uncacheable": len(self._uncacheable),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
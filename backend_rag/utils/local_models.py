@@ -0,0 +1,99 @@
+from typing import Any, AsyncIterator, List, Optional
+import asyncio
+import hashlib
+import re
+import time
+
+import numpy as np
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+_TOKEN = re.compile(r"\w+")
+
+
+class HashingEmbeddings:
+    """Deterministic offline embeddings: hashed word and word-bigram counts, L2-normalized.
+
+    Texts sharing words get similar vectors, which is enough to exercise
+    retrieval end to end without an embeddings API.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+        self.model = f"hashing-{dimensions}"
+
+    def _bucket(self, feature: str) -> int:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        words = _TOKEN.findall(text.lower())
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in words:
+            vector[self._bucket(word)] += 1.0
+        for first, second in zip(words, words[1:]):
+            vector[self._bucket(f"{first} {second}")] += 0.5
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    # ``timeout`` is accepted like the API clients' one; hashing never waits
+    def embed_query(self, text: str, timeout: Optional[float] = None) -> List[float]:
+        return self._embed(text)
+
+    def embed_documents(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+
+class EchoLLM:
+    """Offline chat model that answers with the first words of the prompt.
+
+    ``latency_ms`` is added before the answer (or the first streamed token)
+    and ``token_latency_ms`` between streamed tokens, so benchmarks see a
+    realistic time profile without calling an API. Like an API client, a
+    call gives up with TimeoutError once it has waited ``timeout`` seconds
+    for the answer (or the first token).
+    """
+
+    def __init__(self, latency_ms: float = 0.0, token_latency_ms: float = 0.0, max_words: int = 40):
+        self.latency_ms = latency_ms
+        self.token_latency_ms = token_latency_ms
+        self.max_words = max_words
+
+    def _words(self, prompt: Any) -> List[str]:
+        return str(prompt).split()[:self.max_words]
+
+    def _message(self, prompt: Any) -> AIMessage:
+        words = self._words(prompt)
+        input_tokens = len(str(prompt).split())
+        return AIMessage(
+            content=" ".join(words),
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": len(words),
+                "total_tokens": input_tokens + len(words)
+            }
+        )
+
+    def _delay(self, prompt: Any) -> float:
+        return (self.latency_ms + self.token_latency_ms * len(self._words(prompt))) / 1000
+
+    def invoke(self, prompt: Any, timeout: Optional[float] = None) -> AIMessage:
+        delay = self._delay(prompt)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"No answer within {timeout:.2f}s")
+        time.sleep(delay)
+        return self._message(prompt)
+
+    async def ainvoke(self, prompt: Any, timeout: Optional[float] = None) -> AIMessage:
+        return await asyncio.wait_for(self._areply(prompt), timeout)
+
+    async def _areply(self, prompt: Any) -> AIMessage:
+        await asyncio.sleep(self._delay(prompt))
+        return self._message(prompt)
+
+    async def astream(self, prompt: Any, timeout: Optional[float] = None) -> AsyncIterator[AIMessageChunk]:
+        await asyncio.wait_for(asyncio.sleep(self.latency_ms / 1000), timeout)
+        for i, word in enumerate(self._words(prompt)):
+            if i:
+                await asyncio.sleep(self.token_latency_ms / 1000)
+            yield AIMessageChunk(content=word if i == 0 else f" {word}")
@@ -0,0 +1,191 @@
+from typing import Any, Callable, Dict, Iterator, Optional
+import logging
+import os
+import re
+import time
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# Request latencies range from cached answers (a few ms) to slow LLM calls (tens of seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+REQUEST_LATENCY = Histogram(
+    "rag_http_request_duration_seconds",
+    "HTTP request latency, until the response body is fully sent",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "rag_http_requests_in_flight",
+    "HTTP requests currently being processed",
+    ["method"],
+    multiprocess_mode="livesum"
+)
+STAGE_LATENCY = Histogram(
+    "rag_stage_duration_seconds",
+    "Latency of the stages of a chat request (embed_query, vector_search, prompt_build, llm, ...)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+TOKENS = Counter(
+    "rag_tokens_total",
+    "Tokens sent to or received from the LLM",
+    ["kind"]
+)
+REQUEST_EVENTS = Counter(
+    "rag_request_events_total",
+    "Per-request events such as fast-path answers, coalesced queries and answer cache hits",
+    ["event"]
+)
+
+UPSTREAM_CALLS = Counter(
+    "rag_upstream_calls_total",
+    "Calls to upstream services (llm, embeddings, vector_store) by outcome: success, retry, error, rejected",
+    ["upstream", "outcome"]
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "rag_upstream_in_flight",
+    "Upstream calls currently in progress; compare with rag_upstream_pool_connections",
+    ["upstream"],
+    multiprocess_mode="livesum"
+)
+UPSTREAM_POOL_SIZE = Gauge(
+    "rag_upstream_pool_connections",
+    "Connection pool size of each upstream client",
+    ["upstream"],
+    multiprocess_mode="livesum"
+)
+CIRCUIT_STATE = Gauge(
+    "rag_circuit_breaker_state",
+    "Circuit breaker state per upstream: 0 closed, 1 half-open, 2 open",
+    ["upstream"],
+    multiprocess_mode="livemax"
+)
+
+ADMISSION = Counter(
+    "rag_admission_total",
+    "Chat admission decisions: admitted, queued, rejected_queue_full, rejected_queue_timeout",
+    ["outcome"]
+)
+ADMISSION_ACTIVE = Gauge(
+    "rag_admission_active",
+    "Chat requests holding an admission slot",
+    multiprocess_mode="livesum"
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "rag_admission_queue_depth",
+    "Chat requests waiting for an admission slot",
+    multiprocess_mode="livesum"
+)
+
+_NAME = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def record_request(timings: Dict[str, float], counters: Dict[str, int]) -> None:
+    """Export the stage timings (in ms) and counters collected by a StageTimer"""
+    for name, value in timings.items():
+        STAGE_LATENCY.labels(stage=name[:-3] if name.endswith("_ms") else name).observe(value / 1000)
+    for name, value in counters.items():
+        if name.endswith("_tokens"):
+            TOKENS.labels(kind=name[:-len("_tokens")]).inc(value)
+        else:
+            REQUEST_EVENTS.labels(event=name).inc(value)
+
+
+class RAGStatsCollector:
+    """Exposes the numeric values of RAGProcessor.stats() (cache hits, sizes, ...) at scrape time"""
+
+    def __init__(self, get_stats: Callable[[], Optional[Dict[str, Any]]]):
+        self.get_stats = get_stats
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        try:
+            stats = self.get_stats()
+        except Exception as e:
+            logger.warning(f"Could not collect RAG stats: {str(e)}")
+            return
+        for component, values in (stats or {}).items():
+            if not isinstance(values, dict):
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                name = _NAME.sub("_", f"rag_{component}_{key}")
+                yield GaugeMetricFamily(name, f"{key} of the {component} component", value=value)
+
+
+_stats_collector: Optional[RAGStatsCollector] = None
+
+
+def register_stats_collector(get_stats: Callable[[], Optional[Dict[str, Any]]]) -> None:
+    """Register (or replace) the collector reading RAGProcessor.stats()"""
+    global _stats_collector
+    if _stats_collector is not None:
+        REGISTRY.unregister(_stats_collector)
+    _stats_collector = RAGStatsCollector(get_stats)
+    REGISTRY.register(_stats_collector)
+
+
+def generate_metrics() -> bytes:
+    """Metrics in the Prometheus text format.
+
+    When PROMETHEUS_MULTIPROC_DIR is set (serve.py with several workers) the
+    request metrics of every worker are aggregated; the RAG stats gauges
+    still come from the worker answering the scrape.
+    """
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if _stats_collector is not None:
+        registry.register(_stats_collector)
+    return generate_latest(registry)
+
+
+def mark_worker_dead() -> None:
+    """Drop the live gauges of this worker process from the multiprocess metrics"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording per-route latency histograms and in-flight gauges.
+
+    Requests are labelled with the route template (``/api/documents/{document_id}``)
+    that the router stores in the scope, not the raw path, to keep label
+    cardinality bounded. The latency covers the whole response, including
+    streamed bodies.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(method=method)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_LATENCY.labels(method=method, route=route, status=str(status["code"])).observe(
+                time.perf_counter() - start
+            )
@@ -1,38 +1,36 @@
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_weaviate import WeaviateVectorStore
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
-import weaviate
-from weaviate.classes import config as wvc
-from weaviate.classes.init import Auth
+from typing import Any, AsyncContextManager, AsyncIterator, Dict, List, Optional, Tuple
 import os
 from dotenv import load_dotenv
 import logging
-import atexit
-from pdf2image import convert_from_path
-import PyPDF2
-from sentence_transformers import SentenceTransformer
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chat_models import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationalRetrievalChain
-from weaviate.auth import AuthApiKey
-from langchain.schema import Document
-import json
-from langchain_core.messages import SystemMessage, HumanMessage
-from datetime import datetime
-import mimetypes
-from tqdm import tqdm
-import unittest
-from unittest.mock import patch, MagicMock
-from weaviate.classes.query import Filter
-import openai
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import time
+from langchain_core.documents import Document
+from utils.admission import AdmissionController
+from utils.answer_cache import CachedAnswer, SemanticAnswerCache
+from utils.context_packer import ContextPacker
+from utils.coalescing import SingleFlight
+from utils.deadline import Deadline, DeadlineExceeded, iterate_within, run_within
+from utils.embedding_cache import QueryEmbeddingCache, normalize_query
+from utils.hot_cache import HotDocumentCache
+from utils.local_models import EchoLLM, HashingEmbeddings
+from utils.reranker import CrossEncoderReranker
+from utils.resilience import ResilientEmbeddings, ResilientLLM, ResilientVectorStore, Upstream
+from utils.retrieval import highlight, reciprocal_rank_fusion
+from utils.service_fields import SERVICE_FIELDS, parse_service_fields
+from utils.service_index import DEFAULT_ID_PATTERN, ServiceIndex
+from utils.session_memory import SessionMemoryStore, Turn, format_turns
+from utils.shared_state import SharedStateStore
+from utils.timing import StageTimer
+from utils.vector_store import InMemoryVectorStore, StoredChunk, VectorStore, WeaviateVectorStore
+
+# langchain_openai, PyPDF2 and tqdm (and the Weaviate client, in utils.vector_store)
+# are imported inside the methods that use them so importing this module stays
+# cheap and never touches the network; the first call pays the import once.
 
 
 # Configure logging
@@ -41,8 +39,11 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-# Ensure you have your OpenAI API key set in your environment variables
-openai.api_key = os.getenv("OPENAI_API_KEY")
+NO_ANSWER_MESSAGE = "Could not find relevant information in the documents."
+DEADLINE_MESSAGE = "The answer could not be generated in time. The most relevant sources are listed below."
+
+# Chunk properties kept in the service-ID index
+SERVICE_RECORD_PROPERTIES = (*SERVICE_FIELDS, "document_id", "file_name", "page", "start_line", "end_line")
 
 class RAGProcessor:
     def __init__(self):
@@ -60,110 +61,725 @@ class RAGProcessor:
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.collection_name = "DocumentChunks"
 
-        # Initialize text splitter
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        
-        # Initialize conversation memory
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
-        
+        # Backends: Weaviate and OpenAI in production; "memory", "hashing" and
+        # "echo" are deterministic local stand-ins that need no network
+        self.vector_store_backend = os.getenv("VECTOR_STORE_BACKEND", "weaviate")
+        self.embeddings_backend = os.getenv("EMBEDDINGS_BACKEND", "openai")
+        self.llm_backend = os.getenv("LLM_BACKEND", "openai")
+        self.top_k = int(os.getenv("RAG_TOP_K", "4"))
+
+        # Retrieval mode: "vector" (dense only) or "hybrid" (BM25 + vector, rank-fused)
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "vector")
+        self.hybrid_alpha = float(os.getenv("HYBRID_ALPHA", "0.5"))
+        self.rrf_k = int(os.getenv("HYBRID_RRF_K", "60"))
+        self.hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", "20"))
+        self._search_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-search")
+
+        # Upstream clients: pool sizes, per-call timeouts (seconds), retries of
+        # idempotent calls and circuit breakers that fail fast while one is down
+        self.openai_timeout = float(os.getenv("OPENAI_TIMEOUT", "60"))
+        self.openai_pool_size = int(os.getenv("OPENAI_POOL_SIZE", "20"))
+        self.weaviate_timeout = float(os.getenv("WEAVIATE_TIMEOUT", "30"))
+        self.weaviate_insert_timeout = float(os.getenv("WEAVIATE_INSERT_TIMEOUT", "90"))
+        self.weaviate_pool_size = int(os.getenv("WEAVIATE_POOL_SIZE", "20"))
+        self._openai_http_clients = None
+        upstream_settings = {
+            "attempts": int(os.getenv("UPSTREAM_RETRY_ATTEMPTS", "3")),
+            "base_delay": float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.2")),
+            "max_delay": float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "2")),
+            "failure_threshold": int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            "reset_timeout": float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+        }
+        # OpenAI calls get OPENAI_TIMEOUT capped by the request deadline; the
+        # Weaviate client only takes timeouts per connection (WEAVIATE_TIMEOUT)
+        self.upstreams = {
+            "llm": Upstream(
+                "llm", self.openai_pool_size if self.llm_backend == "openai" else None,
+                timeout=self.openai_timeout, **upstream_settings
+            ),
+            "embeddings": Upstream(
+                "embeddings", self.openai_pool_size if self.embeddings_backend == "openai" else None,
+                timeout=self.openai_timeout, **upstream_settings
+            ),
+            "vector_store": Upstream("vector_store", self.weaviate_pool_size if self.vector_store_backend == "weaviate" else None, **upstream_settings)
+        }
+
+        # Optional cross-encoder rerank stage: over-fetch candidates, keep the best top_k
+        self.reranker = None
+        if os.getenv("RERANK_ENABLED", "false").lower() == "true":
+            self.reranker = CrossEncoderReranker(
+                model_name=os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+                candidates=int(os.getenv("RERANK_CANDIDATES", "20")),
+                top_n=self.top_k,
+                latency_budget_ms=float(os.getenv("RERANK_LATENCY_BUDGET_MS", "150")),
+                max_concurrent=int(os.getenv("RERANK_MAX_CONCURRENT", "2"))
+            )
+
         # Initialize the language model
-        self.llm = ChatOpenAI() 
+        self.llm = self._create_llm()
         
-        # Initialize RAG components if credentials are available
-        if all([self.cluster_url, self.api_key, self.openai_api_key]):
-            self._initialize_rag_components()
+        # Shared RAG components are created once by connect() (called from the
+        # FastAPI lifespan hook) and reused by every request
+        self.embeddings = None
+        self.vector_store: Optional[VectorStore] = None
+        self._connect_lock = threading.Lock()
+        self._last_health_check = 0.0
+        self.health_check_interval = float(os.getenv("WEAVIATE_HEALTH_CHECK_INTERVAL", "30"))
+
+        # Semantic cache for answers to repeated questions
+        self.answer_cache = None
+        if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true":
+            self.answer_cache = SemanticAnswerCache(
+                similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+                ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+                max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+            )
+
+        # Exact service-ID index for the fast path that bypasses vector search.
+        # SERVICE_FAST_PATH: "template" answers from the stored fields, "llm"
+        # uses a tiny prompt with only the matched services, "off" disables it
+        self.fast_path_mode = os.getenv("SERVICE_FAST_PATH", "template").lower()
+        self.service_index = None
+        if self.fast_path_mode != "off":
+            self.service_index = ServiceIndex(os.getenv("SERVICE_ID_PATTERN", DEFAULT_ID_PATTERN))
+
+        # Token-budgeted context packing for the prompt
+        self.context_packer = ContextPacker(
+            max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "1500")),
+            duplicate_threshold=float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+        )
+
+        # Document catalog, change log and sessions shared by the worker processes
+        # of one deployment (serve.py); unset SHARED_STATE_PATH for a single process
+        self.shared_state = None
+        shared_state_path = os.getenv("SHARED_STATE_PATH")
+        if shared_state_path:
+            self.shared_state = SharedStateStore(shared_state_path)
+        self.worker_id = os.getpid()
+        self.shared_state_poll_interval = float(os.getenv("SHARED_STATE_POLL_INTERVAL", "1"))
+        self._last_event_id = self.shared_state.last_event_id() if self.shared_state is not None else 0
+        self._last_sync = time.monotonic()
+        self._sync_lock = threading.Lock()
+
+        # Bounded conversation memory per session id
+        self.session_memory = SessionMemoryStore(
+            max_turns=int(os.getenv("SESSION_MAX_TURNS", "6")),
+            max_tokens=int(os.getenv("SESSION_MAX_TOKENS", "800")),
+            ttl_seconds=float(os.getenv("SESSION_TTL", "1800")),
+            max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "10000")),
+            count_tokens=self.context_packer.count_tokens,
+            summarizer=self._summarize_turns,
+            shared=self.shared_state
+        )
+        self._background_tasks = set()
+
+        # Optional in-process vector cache for frequently queried documents
+        self.hot_cache = None
+        self.hot_cache_max_chunks = int(os.getenv("HOT_CACHE_MAX_CHUNKS", "10000"))
+        if os.getenv("HOT_CACHE_ENABLED", "false").lower() == "true":
+            self.hot_cache = HotDocumentCache(
+                loader=self._fetch_document_chunks,
+                max_bytes=int(float(os.getenv("HOT_CACHE_MAX_MB", "256")) * 1024 * 1024),
+                promote_after=int(os.getenv("HOT_CACHE_PROMOTE_AFTER", "3"))
+            )
+
+        # Concurrency caps for /api/chat/batch
+        self.batch_max_questions = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+        self.batch_retrieval_concurrency = int(os.getenv("BATCH_RETRIEVAL_CONCURRENCY", "8"))
+        self.batch_llm_concurrency = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+        # Admission control in front of /api/chat and /api/chat/stream: at most
+        # CHAT_MAX_CONCURRENT chats run (0: unlimited), the rest wait in a bounded
+        # queue and are rejected with 503 when they cannot start in time
+        self.chat_admission = AdmissionController(
+            max_concurrent=int(os.getenv("CHAT_MAX_CONCURRENT", "32")),
+            max_queue=int(os.getenv("CHAT_MAX_QUEUE", "128")),
+            queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT", "10")),
+            fair=os.getenv("CHAT_FAIR_QUEUING", "false").lower() == "true"
+        )
+        # Header naming the client for fair queuing (the client address otherwise)
+        self.client_id_header = os.getenv("CLIENT_ID_HEADER", "X-Client-ID")
+
+        # Per-request time budget in seconds: the DEADLINE_HEADER value when a
+        # client sends one, else REQUEST_TIMEOUT, capped at REQUEST_MAX_TIMEOUT
+        self.deadline_header = os.getenv("DEADLINE_HEADER", "X-Request-Timeout")
+        self.request_timeout = float(os.getenv("REQUEST_TIMEOUT", "30"))
+        self.max_request_timeout = float(os.getenv("REQUEST_MAX_TIMEOUT", "120"))
+
+        # Single-flight coalescing of identical concurrent chat queries
+        self.coalescer = SingleFlight()
+
+        # Exact-match cache of query embeddings, optionally shared across workers
+        self.embedding_cache = None
+        if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true":
+            self.embedding_cache = QueryEmbeddingCache(
+                max_bytes=int(float(os.getenv("EMBEDDING_CACHE_MAX_MB", "64")) * 1024 * 1024),
+                path=os.getenv("EMBEDDING_CACHE_PATH"),
+                max_shared_entries=int(os.getenv("EMBEDDING_CACHE_SHARED_MAX_ENTRIES", "100000"))
+            )
             
         logger.info(f"RAGProcessor initialized with upload_dir: {self.upload_dir}, preview_dir: {self.preview_dir}")
 
+    @property
+    def rag_enabled(self) -> bool:
+        """Whether credentials for the configured RAG backends are available"""
+        required = []
+        if self.vector_store_backend == "weaviate":
+            required += [self.cluster_url, self.api_key, self.openai_api_key]
+        if self.embeddings_backend == "openai":
+            required.append(self.openai_api_key)
+        if self.llm_backend == "openai":
+            required.append(self.openai_api_key)
+        return all(required)
+
+    def _openai_clients(self) -> Dict[str, Any]:
+        """HTTP clients with bounded connection pools, shared by the OpenAI chat and embeddings clients"""
+        if self._openai_http_clients is None:
+            import httpx
+            limits = httpx.Limits(max_connections=self.openai_pool_size, max_keepalive_connections=self.openai_pool_size)
+            self._openai_http_clients = {
+                "http_client": httpx.Client(limits=limits, timeout=self.openai_timeout),
+                "http_async_client": httpx.AsyncClient(limits=limits, timeout=self.openai_timeout)
+            }
+        return {
+            **self._openai_http_clients,
+            "timeout": self.openai_timeout,
+            # Retries are done by the Upstream, with its circuit breaker
+            "max_retries": 0
+        }
+
+    def _create_llm(self) -> Any:
+        """Chat model selected by LLM_BACKEND"""
+        if self.llm_backend == "echo":
+            llm = EchoLLM(
+                latency_ms=float(os.getenv("ECHO_LLM_LATENCY_MS", "0")),
+                token_latency_ms=float(os.getenv("ECHO_LLM_TOKEN_LATENCY_MS", "0"))
+            )
+        else:
+            from langchain_openai import ChatOpenAI
+            llm = ChatOpenAI(api_key=self.openai_api_key, **self._openai_clients())
+        return ResilientLLM(llm, self.upstreams["llm"])
+
+    def _create_embeddings(self) -> Any:
+        """Embeddings client selected by EMBEDDINGS_BACKEND"""
+        if self.embeddings_backend == "hashing":
+            embeddings = HashingEmbeddings(dimensions=int(os.getenv("HASHING_EMBEDDING_DIMENSIONS", "256")))
+        else:
+            from langchain_openai import OpenAIEmbeddings
+            embeddings = OpenAIEmbeddings(openai_api_key=self.openai_api_key, **self._openai_clients())
+        return ResilientEmbeddings(embeddings, self.upstreams["embeddings"])
+
+    def _create_vector_store(self) -> VectorStore:
+        """Vector store selected by VECTOR_STORE_BACKEND"""
+        if self.vector_store_backend == "memory":
+            store = InMemoryVectorStore(embed=self.embeddings.embed_documents)
+        else:
+            store = WeaviateVectorStore(
+                self.cluster_url, self.api_key, self.openai_api_key, self.collection_name,
+                query_timeout=self.weaviate_timeout,
+                insert_timeout=self.weaviate_insert_timeout,
+                pool_size=self.weaviate_pool_size
+            )
+        return ResilientVectorStore(store, self.upstreams["vector_store"])
+
+    def connect(self) -> None:
+        """Create the shared RAG components if credentials are available.
+
+        An unreachable vector store is logged rather than raised, so the
+        app still starts; ensure_connected() retries on the next request.
+        """
+        if not self.rag_enabled:
+            logger.warning("Missing Weaviate/OpenAI credentials, RAG components not initialized")
+            return
+        with self._connect_lock:
+            if self.vector_store is None:
+                try:
+                    self._open_vector_store()
+                except Exception as e:
+                    logger.warning(f"Vector store unavailable at startup, will retry on the first request: {str(e)}")
+
+        # Load the rerank model at startup rather than on the first chat
+        if self.reranker is not None:
+            self.reranker.load()
+
+    def _open_vector_store(self) -> None:
+        """Connect the vector store and rebuild the state derived from its contents"""
+        self._initialize_rag_components()
+        self._load_service_index()
+        self._replay_shared_documents()
+
     def _initialize_rag_components(self):
         """Initialize RAG-specific components"""
         try:
-            self.embeddings = OpenAIEmbeddings(openai_api_key=self.openai_api_key)
-            
-            # Initialize Weaviate client
-            self.client = weaviate.connect_to_weaviate_cloud(
-                cluster_url=self.cluster_url,
-                auth_credentials=Auth.api_key(self.api_key),
-                headers={'X-OpenAI-Api-Key': self.openai_api_key}
-            )
-            
-            # Initialize or get collection
-            self._initialize_collection()
+            if self.embeddings is None:
+                self.embeddings = self._create_embeddings()
             
-            # Initialize vector store
-            self.vectorstore = WeaviateVectorStore(
-                client=self.client,
-                index_name=self.collection_name,
-                text_key="text",
-                embedding=self.embeddings,
-            )
-            
-            # Register cleanup
-            atexit.register(self.cleanup)
+            # Connect the vector store (creating the collection if needed)
+            vector_store = self._create_vector_store()
+            vector_store.connect()
+            self.vector_store = vector_store
+            self._last_health_check = time.monotonic()
             
             logger.info("Successfully initialized RAG components")
         except Exception as e:
             logger.error(f"Failed to initialize RAG components: {str(e)}")
             raise
 
-    def _initialize_collection(self) -> None:
-        """Initialize or get the Weaviate collection."""
+    def ensure_connected(self) -> None:
+        """Reconnect the vector store if it is no longer healthy.
+
+        The full readiness probe is a network call, so it only runs once per
+        ``health_check_interval``; in between only the local connection state
+        is checked.
+        """
+        if not self.rag_enabled:
+            return
+        if (
+            self.vector_store is not None
+            and self.vector_store.is_connected()
+            and time.monotonic() - self._last_health_check < self.health_check_interval
+        ):
+            return
+
+        with self._connect_lock:
+            try:
+                healthy = self.vector_store is not None and self.vector_store.is_ready()
+            except Exception as e:
+                logger.warning(f"Vector store health check failed: {str(e)}")
+                healthy = False
+
+            if healthy:
+                self._last_health_check = time.monotonic()
+                return
+
+            logger.warning("Vector store unhealthy, reconnecting...")
+            self._close_vector_store()
+            self._open_vector_store()
+
+    def _load_service_index(self) -> None:
+        """Build the service-ID index from the chunks already stored in the vector store"""
+        if self.service_index is None or self.vector_store is None:
+            return
         try:
-            if self.client.collections.exists(self.collection_name):
-                self.collection = self.client.collections.get(self.collection_name)
-                logger.info(f"Using existing collection: {self.collection_name}")
-            else:
-                # Create new collection with properties
-                self.collection = self.client.collections.create(
-                    name=self.collection_name,
-                    vectorizer_config=wvc.Configure.Vectorizer.text2vec_openai(),
-                    generative_config=wvc.Configure.Generative.openai(),
-                    properties=[
-                        wvc.Property(name="text", data_type=wvc.DataType.TEXT),
-                        wvc.Property(name="document_id", data_type=wvc.DataType.TEXT),
-                        wvc.Property(name="page", data_type=wvc.DataType.INT),
-                        wvc.Property(name="start_line", data_type=wvc.DataType.INT),
-                        wvc.Property(name="end_line", data_type=wvc.DataType.INT),
-                        wvc.Property(name="section_title", data_type=wvc.DataType.TEXT),
-                        wvc.Property(name="file_name", data_type=wvc.DataType.TEXT),
-                    ]
-                )
-                logger.info(f"Created new collection: {self.collection_name}")
+            records = (
+                chunk.properties
+                for chunk in self.vector_store.iterate(properties=list(SERVICE_RECORD_PROPERTIES))
+            )
+            count = self.service_index.load(records)
+            logger.info(f"Loaded {count} service IDs into the service index")
         except Exception as e:
-            logger.error(f"Failed to initialize collection: {e}")
-            raise
+            logger.warning(f"Could not load the service index, fast path starts empty: {str(e)}")
+
+    def _replay_shared_documents(self) -> None:
+        """Ingest the catalog documents into a vector store that is local to this worker"""
+        if self.shared_state is None or self.vector_store.shared:
+            return
+        replayed = 0
+        for document_id, file_path in self.shared_state.document_files():
+            if not file_path or not Path(file_path).exists():
+                continue
+            try:
+                self.process_document(Path(file_path), document_id, publish=False)
+                replayed += 1
+            except Exception as e:
+                logger.error(f"Could not replay document {document_id}: {str(e)}")
+        logger.info(f"Replayed {replayed} shared documents into the local vector store")
+
+    def _publish(self, kind: str, document_id: str, file_path: Optional[Path] = None) -> None:
+        """Tell the other workers that a document was updated or deleted"""
+        if self.shared_state is None:
+            return
+        try:
+            self.shared_state.publish(kind, document_id, self.worker_id, str(file_path) if file_path else None)
+        except Exception as e:
+            logger.error(f"Could not publish {kind} event for document {document_id}: {str(e)}")
+
+    def sync_shared_state(self) -> None:
+        """Apply document changes made by other workers.
+
+        Polls the shared change log at most once per
+        ``shared_state_poll_interval``; a request arriving while another one
+        is syncing does not wait for it.
+        """
+        if self.shared_state is None or time.monotonic() - self._last_sync < self.shared_state_poll_interval:
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sync = time.monotonic()
+            for event in self.shared_state.events_since(self._last_event_id):
+                self._last_event_id = event["id"]
+                if event["worker"] != self.worker_id:
+                    self._apply_shared_event(event)
+        except Exception as e:
+            logger.error(f"Error syncing shared state: {str(e)}")
+        finally:
+            self._sync_lock.release()
+
+    def _apply_shared_event(self, event: Dict[str, Any]) -> None:
+        document_id = event["document_id"]
+        logger.info(f"Applying {event['kind']} of document {document_id} from worker {event['worker']}")
+        local_store = self.vector_store is not None and not self.vector_store.shared
+        if local_store:
+            # This worker holds its own copy of the chunks
+            self.vector_store.delete_document(document_id)
+        self.invalidate_document(document_id)
+        if event["kind"] != "updated":
+            return
+        if local_store:
+            file_path = Path(event["file_path"] or "")
+            if file_path.is_file():
+                self.process_document(file_path, document_id, publish=False)
+        elif self.service_index is not None and self.vector_store is not None:
+            for chunk in self.vector_store.fetch_document(document_id, self.hot_cache_max_chunks):
+                self.service_index.add({name: chunk.properties.get(name) for name in SERVICE_RECORD_PROPERTIES})
+
+    @staticmethod
+    def _scope_ids(document_id: Optional[str] = None, document_ids: Optional[List[str]] = None) -> List[str]:
+        """Merge a single document id and a list of ids into one de-duplicated list"""
+        ids = list(document_ids or [])
+        if document_id:
+            ids.append(document_id)
+        return list(dict.fromkeys(ids))
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query with the shared embeddings client, reusing cached embeddings"""
+        if self.embeddings is None:
+            raise RuntimeError("RAG components are not initialized")
+
+        model = getattr(self.embeddings, "model", "default")
+        if self.embedding_cache is not None:
+            vector = self.embedding_cache.get(model, query)
+            if vector is not None:
+                return vector
+
+        vector = self.embeddings.embed_query(query)
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(model, query, vector)
+        return vector
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed many queries with a single embeddings call for the cache misses"""
+        if self.embeddings is None:
+            raise RuntimeError("RAG components are not initialized")
+
+        model = getattr(self.embeddings, "model", "default")
+        vectors: List[Optional[List[float]]] = [
+            self.embedding_cache.get(model, query) if self.embedding_cache is not None else None
+            for query in queries
+        ]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # De-duplicate so repeated questions in one batch are embedded once
+            unique = list(dict.fromkeys(queries[i] for i in missing))
+            embedded = dict(zip(unique, self.embeddings.embed_documents(unique)))
+            for i in missing:
+                vectors[i] = embedded[queries[i]]
+            if self.embedding_cache is not None:
+                for query, vector in embedded.items():
+                    self.embedding_cache.put(model, query, vector)
+        return vectors
+
+    @staticmethod
+    def _to_document(chunk: StoredChunk) -> Document:
+        """Convert a vector store result into a Document carrying its score"""
+        metadata = dict(chunk.properties)
+        text = metadata.pop("text", "") or ""
+        metadata["uuid"] = chunk.uuid
+        metadata["distance"] = chunk.distance
+        metadata["score"] = 1.0 - chunk.distance if chunk.distance is not None else chunk.score
+        return Document(page_content=text, metadata=metadata)
+
+    def _fetch_document_chunks(self, document_id: str) -> Optional[Tuple[List[Dict[str, Any]], List[List[float]]]]:
+        """Load every chunk of a document with its vector (used to fill the hot-document cache).
+
+        Returns None when the document has more than HOT_CACHE_MAX_CHUNKS
+        chunks or a chunk without a vector: searching a partial copy would
+        miss the chunks left out.
+        """
+        chunks, vectors = [], []
+        stored = self.vector_store.fetch_document(document_id, self.hot_cache_max_chunks + 1)
+        if len(stored) > self.hot_cache_max_chunks:
+            return None
+        for chunk in stored:
+            if chunk.vector is None:
+                return None
+            chunks.append({**chunk.properties, "uuid": chunk.uuid})
+            vectors.append(chunk.vector)
+        return chunks, vectors
+
+    def search_by_vector(self, vector: List[float], document_ids: Optional[List[str]] = None, limit: Optional[int] = None) -> List[Document]:
+        """Nearest-neighbour search, filtered to the given documents.
+
+        Queries scoped to hot documents are answered from the in-process
+        cache; everything else goes to the vector store.
+        """
+        if self.vector_store is None:
+            raise RuntimeError("RAG components are not initialized")
+
+        if document_ids and self.hot_cache is not None:
+            hits = self.hot_cache.search(vector, document_ids, limit or self.top_k)
+            if hits is not None:
+                return [self._hot_document(chunk, score) for chunk, score in hits]
+
+        chunks = self.vector_store.near_vector(vector, document_ids or [], limit or self.top_k)
+        return [self._to_document(chunk) for chunk in chunks]
+
+    @staticmethod
+    def _hot_document(chunk: Dict[str, Any], score: float) -> Document:
+        """Convert a hot-cache hit into a Document shaped like a vector store result"""
+        metadata = dict(chunk)
+        text = metadata.pop("text", "") or ""
+        metadata["distance"] = 1.0 - score
+        metadata["score"] = score
+        return Document(page_content=text, metadata=metadata)
+
+    def keyword_search(self, query: str, document_ids: Optional[List[str]] = None, limit: Optional[int] = None) -> List[Document]:
+        """BM25 keyword search in the vector store, filtered to the given documents"""
+        if self.vector_store is None:
+            raise RuntimeError("RAG components are not initialized")
+
+        chunks = self.vector_store.bm25(query, document_ids or [], limit or self.top_k)
+        return [self._to_document(chunk) for chunk in chunks]
+
+    def hybrid_search(self, query: str, vector: List[float], document_ids: Optional[List[str]] = None, limit: Optional[int] = None) -> List[Document]:
+        """Run BM25 and vector search concurrently and fuse them by reciprocal rank"""
+        limit = limit or self.top_k
+        candidates = max(limit, self.hybrid_candidates)
+
+        # Run in a copy of this context so the keyword search sees the request deadline
+        keyword_future = self._search_executor.submit(
+            contextvars.copy_context().run, self.keyword_search, query, document_ids, candidates
+        )
+        vector_docs = self.search_by_vector(vector, document_ids, candidates)
+        keyword_docs = keyword_future.result()
+
+        return reciprocal_rank_fusion(vector_docs, keyword_docs, alpha=self.hybrid_alpha, k=self.rrf_k, limit=limit)
+
+    def _search(self, query: str, vector: List[float], document_ids: List[str], mode: Optional[str] = None) -> List[Document]:
+        """Search with the configured retrieval mode, then rerank if enabled"""
+        limit = self.reranker.candidates if self.reranker is not None else self.top_k
+
+        if (mode or self.retrieval_mode) == "hybrid":
+            docs = self.hybrid_search(query, vector, document_ids, limit)
+        else:
+            docs = self.search_by_vector(vector, document_ids, limit)
+
+        if self.reranker is not None:
+            docs = self.reranker.rerank(query, docs)
+        return docs
+
+    def retrieve(
+        self,
+        query: str,
+        document_id: Optional[str] = None,
+        document_ids: Optional[List[str]] = None,
+        mode: Optional[str] = None
+    ) -> List[Document]:
+        """Retrieve the chunks most relevant to the query, optionally scoped to documents"""
+        return self._search(query, self.embed_query(query), self._scope_ids(document_id, document_ids), mode)
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        document_ids: Optional[List[str]] = None,
+        score_threshold: Optional[float] = None,
+        mode: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Retrieval-only search: ranked chunks with scores, location and highlights, no LLM.
+
+        The score is cosine similarity for vector search and the fused rank
+        score in hybrid mode. Reranking is skipped to keep latency low.
+        """
+        vector = self.embed_query(query)
+        scope = document_ids or []
+        if (mode or self.retrieval_mode) == "hybrid":
+            docs = self.hybrid_search(query, vector, scope, top_k)
+        else:
+            docs = self.search_by_vector(vector, scope, top_k)
+
+        results = []
+        for doc in docs:
+            metadata = doc.metadata
+            score = metadata.get("fusion_score", metadata.get("score"))
+            if score_threshold is not None and (score is None or score < score_threshold):
+                continue
+            results.append({
+                "id": metadata.get("uuid"),
+                "document_id": metadata.get("document_id"),
+                "file_name": metadata.get("file_name"),
+                "page": metadata.get("page"),
+                "start_line": metadata.get("start_line"),
+                "end_line": metadata.get("end_line"),
+                "section_title": metadata.get("section_title"),
+                "service_id": metadata.get("service_id"),
+                "service_name": metadata.get("service_name"),
+                "score": score,
+                "text": doc.page_content,
+                "highlights": highlight(doc.page_content, query)
+            })
+        return results
+
+    def _lookup_or_retrieve(
+        self,
+        query: str,
+        document_ids: List[str],
+        vector: Optional[List[float]] = None,
+        timer: Optional[StageTimer] = None,
+        use_cache: bool = True
+    ) -> Tuple[List[float], Optional[CachedAnswer], List[Document]]:
+        """Embed the query (unless already embedded), then answer from the cache or fall back to vector search.
+
+        ``use_cache=False`` skips the answer cache, e.g. for follow-up
+        questions whose answer depends on the conversation history.
+        """
+        timer = timer or StageTimer()
+        if vector is None:
+            with timer.stage("embed_query"):
+                vector = self.embed_query(query)
+        if self.answer_cache is not None and use_cache:
+            cached = self.answer_cache.lookup(vector, document_ids)
+            if cached is not None:
+                timer.count("answer_cache_hits", 1)
+                return vector, cached, []
+        with timer.stage("vector_search"):
+            return vector, None, self._search(query, vector, document_ids)
+
+    async def _aretrieve(
+        self,
+        query: str,
+        document_ids: List[str],
+        vector: Optional[List[float]],
+        timer: StageTimer,
+        use_cache: bool,
+        deadline: Optional[Deadline]
+    ) -> Tuple[List[float], Optional[CachedAnswer], List[Document]]:
+        """_lookup_or_retrieve in a worker thread, within what is left of ``deadline``.
+
+        The thread records its stages on a timer of its own, merged into
+        ``timer`` only if it finishes in time: an abandoned retrieval must
+        not write into a request that has already been answered.
+        """
+        retrieval_timer = StageTimer()
+        result = await run_within(
+            deadline, "retrieval",
+            asyncio.to_thread(self._lookup_or_retrieve, query, document_ids, vector, retrieval_timer, use_cache)
+        )
+        timer.merge(retrieval_timer)
+        return result
+
+    def _cache_answer(
+        self,
+        vector: List[float],
+        document_ids: List[str],
+        content: str,
+        sources: List[Dict],
+        retrieved_docs: List[Document],
+        start: float
+    ) -> None:
+        """Store a freshly generated answer in the semantic cache"""
+        if self.answer_cache is None:
+            return
+        self.answer_cache.store(
+            vector,
+            document_ids,
+            answer=content,
+            sources=sources,
+            cited_documents=[doc.metadata.get("document_id") for doc in retrieved_docs],
+            latency_ms=(time.perf_counter() - start) * 1000
+        )
+
+    def backfill_service_fields(self) -> int:
+        """Parse and store the service fields of chunks ingested before they existed"""
+        if self.vector_store is None:
+            raise RuntimeError("RAG components are not initialized")
+
+        updated = 0
+        for chunk in self.vector_store.iterate(properties=["text", "service_id"], include_vector=True):
+            if chunk.properties.get("service_id") is not None:
+                continue
+            # Pass the existing vector so the update does not re-vectorize the chunk
+            self.vector_store.update(
+                chunk.uuid,
+                parse_service_fields(chunk.properties.get("text") or ""),
+                vector=chunk.vector
+            )
+            updated += 1
+            if updated % 500 == 0:
+                logger.info(f"Backfilled service fields for {updated} chunks...")
+
+        logger.info(f"Backfilled service fields for {updated} chunks")
+        return updated
+
+    def invalidate_document(self, document_id: str) -> None:
+        """Drop cached state derived from a document"""
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate_document(document_id)
+        if self.service_index is not None:
+            self.service_index.remove_document(document_id)
+        if self.hot_cache is not None:
+            self.hot_cache.invalidate(document_id)
+
+    def delete_document(self, document_id: str) -> None:
+        """Remove a document's chunks from the vector store and invalidate caches that depend on it"""
+        try:
+            if self.vector_store is not None:
+                deleted = self.vector_store.delete_document(document_id)
+                logger.info(f"Deleted {deleted} chunks for document {document_id}")
+        finally:
+            self.invalidate_document(document_id)
+            self._publish("deleted", document_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Runtime statistics of the RAG caches"""
+        return {
+            "answer_cache": self.answer_cache.stats() if self.answer_cache is not None else None,
+            "embedding_cache": self.embedding_cache.stats() if self.embedding_cache is not None else None,
+            "reranker": self.reranker.stats() if self.reranker is not None else None,
+            "service_index": self.service_index.stats() if self.service_index is not None else None,
+            "sessions": self.session_memory.stats(),
+            "coalescing": self.coalescer.stats(),
+            "chat_admission": self.chat_admission.stats(),
+            "hot_cache": self.hot_cache.stats() if self.hot_cache is not None else None,
+            "shared_state": self.shared_state.stats() if self.shared_state is not None else None,
+            **{f"upstream_{name}": upstream.stats() for name, upstream in self.upstreams.items()}
+        }
 
     def _store_chunk(self, text: str, document_id: str, page: int, start_line: int, end_line: int, section_title: str, file_name: str):
         """Store a chunk in the vector store with metadata"""
         try:
-            # Create object in Weaviate using the new API
-            self.collection.data.insert({
+            # Store the chunk with the service fields parsed once here
+            # instead of on every query
+            properties = {
                 "text": text,
                 "document_id": document_id,
                 "page": page,
                 "start_line": start_line,
                 "end_line": end_line,
                 "section_title": section_title,
-                "file_name": file_name
-            })
+                "file_name": file_name,
+                **parse_service_fields(text)
+            }
+            self.vector_store.insert(properties)
+
+            if self.service_index is not None:
+                self.service_index.add({name: properties[name] for name in SERVICE_RECORD_PROPERTIES})
             
             logger.info(f"Stored chunk for {file_name} (page {page}, lines {start_line}-{end_line})")
         except Exception as e:
             logger.error(f"Error storing chunk: {str(e)}")
             raise
 
-    def process_document(self, file_path: Path, document_id: str) -> Dict[str, Any]:
-        """Process document and add to vector store"""
+    def process_document(self, file_path: Path, document_id: str, publish: bool = True) -> Dict[str, Any]:
+        """Process document and add to vector store (``publish`` tells the other workers about it)"""
+        import PyPDF2
+        from tqdm import tqdm
+
         try:
             logger.info(f"Processing document: {file_path}")
+            # Answers built from a previous version of this document are stale
+            self.invalidate_document(document_id)
             preview_zones = []
             total_pages = 1
             file_name = file_path.name
@@ -261,6 +877,12 @@ class RAGProcessor:
                                 else:
                                     section_text.append(line)
 
+            # Queries during ingestion may have cached a partial copy of the document
+            if self.hot_cache is not None:
+                self.hot_cache.invalidate(document_id)
+            if publish:
+                self._publish("updated", document_id, file_path)
+
             logger.info("Document processing completed successfully")
             return {
                 "status": "success",
@@ -275,119 +897,568 @@ class RAGProcessor:
             logger.error(f"Error processing document: {str(e)}")
             raise
 
-    def get_response(self, query: str, document_id: Optional[str] = None, chat_history: Optional[List[Dict]] = None) -> Tuple[str, List[Dict]]:
-        """Get response for a query using the RAG system"""
+    def _build_prompt(self, query: str, retrieved_docs: List[Document], timer: Optional[StageTimer] = None, history: str = "") -> str:
+        """Build the LLM prompt from the query and the retrieved chunks"""
+        # Pack the context: merge adjacent sections, drop overlaps, respect the token budget
+        context, context_tokens, packed_docs = self.context_packer.pack(retrieved_docs)
+
+        # Optionally, log metadata if needed
+        for doc in packed_docs:
+            logger.info(f"Retrieved Document Metadata: {doc.metadata}")
+
+        # Create the prompt with context
+        template = """
+        You are a helpful assistant that answers questions based on the provided context.
+        Use the provided context to answer the Question_from_client.
+        the answer is in the Context_that_has_the_answer.
+        Question_from_client= {input}
+        Context_that_has_the_answer= {context}
+        """
+        prompt = template.format(input=query, context=context)
+        if history:
+            prompt += f"        Conversation_so_far= {history}\n"
+
+        prompt_tokens = self.context_packer.count_tokens(prompt)
+        logger.info(
+            f"Prompt: {prompt_tokens} tokens, {len(packed_docs)}/{len(retrieved_docs)} passages, "
+            f"{context_tokens} context tokens"
+        )
+        if timer is not None:
+            timer.count("prompt_tokens", prompt_tokens)
+            timer.count("context_passages", len(packed_docs))
+        return prompt
+
+    def _extract_sources(self, retrieved_docs: List[Document]) -> List[Dict]:
+        """Build sources from the service fields stored with the retrieved chunks"""
+        sources = []
+        seen_ids = set()
+
+        for doc in retrieved_docs:
+            # Get metadata
+            metadata = doc.metadata
+            start_line = metadata.get("start_line", 0)
+            end_line = metadata.get("end_line", 0)
+            file_name = metadata.get("file_name", "Unknown")
+            page = metadata.get("page", 1)
+
+            # Chunks stored before the service fields existed have no
+            # service_id property yet; parse them until they are backfilled
+            if metadata.get("service_id") is None:
+                service_info = parse_service_fields(doc.page_content)
+            else:
+                service_info = metadata
+            service_id = service_info.get("service_id")
+
+            # Skip if we've already seen this service ID or if it's empty
+            if not service_id or service_id in seen_ids or not service_info.get('description'):
+                logger.info(f"Skipping chunk without a new service entry (service ID: {service_id or 'none'})")
+                continue
+
+            seen_ids.add(service_id)
+
+            sources.append(self._source_from_record({
+                **service_info,
+                "file_name": file_name,
+                "page": page,
+                "start_line": start_line,
+                "end_line": end_line
+            }))
+
+            logger.info(f"Processed service ID: {service_id} (lines {start_line}-{end_line})")
+
+        return sources
+
+    @staticmethod
+    def _source_from_record(record: Dict[str, Any], relevance_score: float = 1.0) -> Dict:
+        """Create source info with all fields at the root level"""
+        return {
+            "document_id": record.get("service_id") or "",
+            "service_name": record.get("service_name") or "",
+            "description": record.get("description") or "",
+            "url": record.get("url") or "",
+            "relevance_score": relevance_score,
+            "file_name": record.get("file_name") or "Unknown",
+            "page": record.get("page") or 1,
+            "start_line": record.get("start_line") or 0,
+            "end_line": record.get("end_line") or 0
+        }
+
+    def _fast_path_sources(self, query: str, document_ids: List[str]) -> List[Dict]:
+        """Sources for the service IDs named in the query, looked up in the exact-ID index"""
+        if self.service_index is None:
+            return []
+        records = self.service_index.find(query, document_ids)
+        sources = [self._source_from_record(record) for record in records if record.get("description")]
+        if sources:
+            logger.info(f"Service ID fast path: {[source['document_id'] for source in sources]}")
+        return sources
+
+    def _fast_path_prompt(self, query: str, sources: List[Dict]) -> Optional[str]:
+        """Tiny prompt with only the matched services, or None to answer from the template"""
+        if self.fast_path_mode != "llm":
+            return None
+        entries = "\n".join(
+            f"- {source['document_id']}: {source['service_name']} - {source['description']} ({source['url']})"
+            for source in sources
+        )
+        return f"Answer the question using only these services.\nServices:\n{entries}\nQuestion: {query}"
+
+    @staticmethod
+    def _template_answer(sources: List[Dict]) -> str:
+        """Answer listing the matched services with their description and link"""
+        responses = []
+        for source in sources:
+            response = f"**{source['service_name'] or source['document_id']}**: {source['description']}"
+            if source.get('url'):
+                response += f"\n→ More information: {source['url']}"
+            responses.append(response)
+        return "\n\n".join(responses)
+
+    @staticmethod
+    def _history_turns(chat_history: Optional[List[Dict]]) -> List[Turn]:
+        """Pair client-side chat messages into (question, answer) turns"""
+        turns = []
+        question = None
+        for message in chat_history or []:
+            content = message.get("content") or ""
+            if message.get("sender") == "user":
+                question = content
+            elif question is not None:
+                turns.append((question, content))
+                question = None
+        return turns
+
+    def _conversation(self, session_id: Optional[str], chat_history: Optional[List[Dict]]) -> str:
+        """Bounded conversation history for the prompt"""
+        turns = self._history_turns(chat_history)
+        if session_id:
+            if turns:
+                self.session_memory.seed(session_id, turns)
+            return self.session_memory.history(session_id)
+        # Without a session only the most recent client-side turns are used,
+        # within the same turn and token limits as a session's history
+        return self.session_memory.bounded(turns)
+
+    async def _aconversation(self, session_id: Optional[str], chat_history: Optional[List[Dict]]) -> str:
+        """_conversation for the async paths; session reads and writes (SQLite when shared) run in a worker thread"""
+        if not session_id:
+            return self._conversation(session_id, chat_history)
+        return await asyncio.to_thread(self._conversation, session_id, chat_history)
+
+    def _remember_turn(self, session_id: Optional[str], query: str, content: str) -> bool:
+        """Record the turn in the session; True when older turns need summarizing"""
+        if not session_id:
+            return False
+        return self.session_memory.add_turn(session_id, query, content)
+
+    async def _aremember_turn(self, session_id: Optional[str], query: str, content: str) -> None:
+        """Record the turn (in a worker thread) and summarize older turns in the background"""
+        if not session_id:
+            return
+        if await asyncio.to_thread(self._remember_turn, session_id, query, content):
+            task = asyncio.create_task(asyncio.to_thread(self.session_memory.compact, session_id))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+    def _summarize_turns(self, summary: str, turns: List[Turn]) -> str:
+        """Fold older conversation turns into a short running summary"""
+        prompt = (
+            "Summarize this conversation in at most three sentences, keeping names, "
+            "service IDs and open questions.\n"
+            f"Previous summary: {summary or 'none'}\n{format_turns(turns)}"
+        )
+        return self._response_content(self.llm.invoke(prompt))
+
+    def _response_content(self, llm_response: Any, timer: Optional[StageTimer] = None) -> str:
+        """Extract the text of an LLM response, recording its completion tokens when reported"""
+        final_response = getattr(llm_response, "content", llm_response)
+        usage = getattr(llm_response, "usage_metadata", None)
+        if timer is not None and usage:
+            timer.count("completion_tokens", usage.get("output_tokens", 0))
+
+        # Ensure final_response is a string
+        if not isinstance(final_response, str):
+            logger.error("Final response is not a string. Converting to string.")
+            final_response = str(final_response)
+
+        logger.info(f"Final response: {final_response}")
+        return final_response
+
+    def _format_answer(self, final_response: str, sources: List[Dict]) -> str:
+        """Append the list of sources to the answer"""
+        # Combine all formatted responses into a single string with proper spacing
+        final_response += "\n\nSources:"
+        for idx, source in enumerate(sources, 1):
+            final_response += f"\n{idx}. Found in {source['file_name']} (Page {source['page']}, Lines {source['start_line']}-{source['end_line']})"
+
+        return final_response
+
+    def _generate(self, query: str, scope: List[str], history: str, timer: StageTimer) -> Tuple[Optional[str], List[Dict]]:
+        """Produce the answer text and its sources (None when nothing relevant was found)"""
+        start = time.perf_counter()
+
+        # Queries naming a known service ID skip vector search entirely
+        sources = self._fast_path_sources(query, scope)
+        if sources:
+            timer.count("fast_path", 1)
+            prompt = self._fast_path_prompt(query, sources)
+            if prompt is None:
+                return self._template_answer(sources), sources
+            with timer.stage("llm"):
+                return self._response_content(self.llm.invoke(prompt), timer), sources
+
+        # Serve repeated stand-alone questions from the cache, otherwise retrieve the
+        # relevant documents, filtered to the requested documents in the vector store
+        with timer.stage("retrieval"):
+            vector, cached, retrieved_docs = self._lookup_or_retrieve(query, scope, timer=timer, use_cache=not history)
+        if cached is not None:
+            return cached.answer, cached.sources
+
+        with timer.stage("source_parsing"):
+            sources = self._extract_sources(retrieved_docs)
+        if not sources:
+            return None, []
+
+        # Call the LLM to get the response
+        with timer.stage("prompt_build"):
+            prompt = self._build_prompt(query, retrieved_docs, timer, history)
+        with timer.stage("llm"):
+            content = self._response_content(self.llm.invoke(prompt), timer)
+        if not history:
+            self._cache_answer(vector, scope, content, sources, retrieved_docs, start)
+        return content, sources
+
+    async def _agenerate(
+        self,
+        query: str,
+        scope: List[str],
+        history: str,
+        timer: StageTimer,
+        vector: Optional[List[float]] = None,
+        retrieval_slot: Optional[AsyncContextManager] = None,
+        llm_slot: Optional[AsyncContextManager] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[Optional[str], List[Dict]]:
+        """Async variant of _generate.
+
+        ``vector`` is a precomputed query embedding; ``retrieval_slot`` and
+        ``llm_slot`` (e.g. semaphores) bound how many retrievals and LLM
+        calls run at once. Each stage gets what is left of ``deadline``;
+        when it runs out during retrieval DeadlineExceeded is raised, during
+        generation the sources are returned with DEADLINE_MESSAGE.
+        """
+        start = time.perf_counter()
+        retrieval_slot = retrieval_slot or nullcontext()
+        llm_slot = llm_slot or nullcontext()
+
+        # Queries naming a known service ID skip vector search entirely
+        sources = self._fast_path_sources(query, scope)
+        if sources:
+            timer.count("fast_path", 1)
+            prompt = self._fast_path_prompt(query, sources)
+            if prompt is None:
+                return self._template_answer(sources), sources
+            try:
+                async with llm_slot:
+                    with timer.stage("llm"):
+                        return self._response_content(await run_within(deadline, "llm", self.llm.ainvoke(prompt)), timer), sources
+            except DeadlineExceeded as e:
+                # The stored fields answer the question without the LLM
+                self._deadline_exceeded(e, timer)
+                return self._template_answer(sources), sources
+
+        # Embedding and the sync vector store client block, so they run in a worker thread
+        async with retrieval_slot:
+            with timer.stage("retrieval"):
+                vector, cached, retrieved_docs = await self._aretrieve(query, scope, vector, timer, not history, deadline)
+        if cached is not None:
+            return cached.answer, cached.sources
+
+        with timer.stage("source_parsing"):
+            sources = self._extract_sources(retrieved_docs)
+        if not sources:
+            return None, []
+
+        with timer.stage("prompt_build"):
+            prompt = self._build_prompt(query, retrieved_docs, timer, history)
         try:
-            # Create retriever from the vector store
-            retriever = self.vectorstore.as_retriever()
-
-            # Retrieve relevant documents
-            retrieved_docs = retriever.get_relevant_documents(query)
-
-            # Prepare the context for the prompt
-            context = "\n".join([doc.page_content for doc in retrieved_docs])
-
-            # Optionally, log metadata if needed
-            for doc in retrieved_docs:
-                logger.info(f"Retrieved Document Metadata: {doc.metadata}")
-
-            # Create the prompt with context
-            template = """
-            You are a helpful assistant that answers questions based on the provided context.
-            Use the provided context to answer the Question_from_client.
-            the answer is in the Context_that_has_the_answer.
-            Question_from_client= {input}
-            Context_that_has_the_answer= {context}
-            """
-            prompt = template.format(input=query, context=context)  # Format the prompt string
-
-            # Call the LLM to get the response
-            final_response = self.llm.invoke(prompt)  # Pass the formatted prompt string
-
-            # Ensure final_response is a string
-            if not isinstance(final_response, str):
-                logger.error("Final response is not a string. Converting to string.")
-                final_response = str(final_response)
-
-            # Process the final response as needed
-            print("****************************\n")
-            print(f"Final response: {final_response}")
-            print("****************************\n")
-
-            # Continue with your existing logic to format responses and sources
-            sources = []
-            seen_ids = set()
-            formatted_responses = []
-
-            for doc in retrieved_docs:
-                # Get metadata
-                metadata = doc.metadata
-                start_line = metadata.get("start_line", 0)
-                end_line = metadata.get("end_line", 0)
-                file_name = metadata.get("file_name", "Unknown")
-                page = metadata.get("page", 1)
-
-                # Extract service ID from content
-                content_lines = doc.page_content.split('\n')
-                service_id = None
-                service_info = {}
-
-                for line in content_lines:
-                    if line.startswith('ID:'):
-                        service_id = line.replace('ID:', '').strip()
-                    elif line.startswith('Lien EN:'):
-                        service_info['url'] = line.replace('Lien EN:', '').strip()
-                    elif line.startswith('Nom du service EN:'):
-                        service_info['name'] = line.replace('Nom du service EN:', '').strip()
-                    elif line.startswith('DESCRIPTION EN EN:'):
-                        service_info['description'] = line.replace('DESCRIPTION EN EN:', '').strip()
-
-                # Skip if we've already seen this service ID or if it's empty
-                if not service_id or service_id in seen_ids or not service_info.get('description'):
-                    logger.warning(f"Skipping service ID: {service_id} - already seen or missing description.")
-                    continue
-
-                seen_ids.add(service_id)
-
-                # Format the response with service information and URL
-                if service_info.get('name') and service_info.get('description'):
-                    response = f"**{service_info['name']}**: {service_info['description']}"
-                    if service_info.get('url'):
-                        response += f"\n→ More information: {service_info['url']}"
-                    formatted_responses.append(response)
-
-                # Create source info with all fields at the root level
-                source_info = {
-                    "document_id": service_id,
-                    "service_name": service_info.get('name', ''),
-                    "description": service_info.get('description', ''),
-                    "url": service_info.get('url', ''),
-                    "relevance_score": 1.0,  # Adjust as needed
-                    "file_name": file_name,
-                    "page": page,
-                    "start_line": start_line,
-                    "end_line": end_line
-                }
-                sources.append(source_info)
+            async with llm_slot:
+                with timer.stage("llm"):
+                    content = self._response_content(await run_within(deadline, "llm", self.llm.ainvoke(prompt)), timer)
+        except DeadlineExceeded as e:
+            self._deadline_exceeded(e, timer)
+            return DEADLINE_MESSAGE, sources
+        if not history:
+            self._cache_answer(vector, scope, content, sources, retrieved_docs, start)
+        return content, sources
 
-                logger.info(f"Processed service ID: {service_id} (lines {start_line}-{end_line})")
+    @staticmethod
+    def _deadline_exceeded(error: DeadlineExceeded, timer: StageTimer) -> None:
+        logger.warning(f"{str(error)}, answering without the LLM")
+        timer.count("deadline_exceeded", 1)
 
-            if not sources:
-                return "Could not find relevant information in the documents.", []
+    def get_response(
+        self,
+        query: str,
+        document_id: Optional[str] = None,
+        chat_history: Optional[List[Dict]] = None,
+        document_ids: Optional[List[str]] = None,
+        timer: Optional[StageTimer] = None,
+        session_id: Optional[str] = None
+    ) -> Tuple[str, List[Dict]]:
+        """Get response for a query using the RAG system"""
+        try:
+            timer = timer or StageTimer()
+            scope = self._scope_ids(document_id, document_ids)
+            history = self._conversation(session_id, chat_history)
 
-            # Combine all formatted responses into a single string with proper spacing
-            final_response += "\n\nSources:"
-            for idx, source in enumerate(sources, 1):
-                final_response += f"\n{idx}. Found in {source['file_name']} (Page {source['page']}, Lines {source['start_line']}-{source['end_line']})"
+            content, sources = self._generate(query, scope, history, timer)
+            if content is None:
+                return NO_ANSWER_MESSAGE, []
 
-            return final_response, sources
+            if self._remember_turn(session_id, query, content):
+                self.session_memory.compact(session_id)
+            return self._format_answer(content, sources), sources
 
         except Exception as e:
             logger.error(f"Error in get_response: {str(e)}", exc_info=True)
             raise
 
+    async def aget_response(
+        self,
+        query: str,
+        document_id: Optional[str] = None,
+        chat_history: Optional[List[Dict]] = None,
+        document_ids: Optional[List[str]] = None,
+        timer: Optional[StageTimer] = None,
+        session_id: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[str, List[Dict]]:
+        """Async variant of get_response that never blocks the event loop"""
+        try:
+            timer = timer or StageTimer()
+            scope = self._scope_ids(document_id, document_ids)
+            history = await self._aconversation(session_id, chat_history)
+
+            if history:
+                # An answer built on one conversation must not reach another session
+                content, sources = await self._agenerate(query, scope, history, timer, deadline=deadline)
+            else:
+                content, sources = await self._agenerate_coalesced(query, scope, timer, deadline)
+            if content is None:
+                return NO_ANSWER_MESSAGE, []
+
+            if content != DEADLINE_MESSAGE:
+                await self._aremember_turn(session_id, query, content)
+            return self._format_answer(content, sources), sources
+
+        except DeadlineExceeded:
+            # Expected under load; the caller reports it (504)
+            raise
+        except Exception as e:
+            logger.error(f"Error in aget_response: {str(e)}", exc_info=True)
+            raise
+
+    async def _agenerate_coalesced(
+        self,
+        query: str,
+        scope: List[str],
+        timer: StageTimer,
+        deadline: Optional[Deadline]
+    ) -> Tuple[Optional[str], List[Dict]]:
+        """_agenerate without history, shared by identical concurrent questions over the same documents.
+
+        The shared work runs until the latest deadline of the requests that
+        joined it; each request waits for it only until its own ``deadline``
+        (DeadlineExceeded). The shared work records its stages on a timer of
+        its own, which every caller merges into its ``timer``; token counts
+        go only to the request that started it, so one LLM call is counted
+        once.
+        """
+        key = (normalize_query(query), tuple(sorted(scope)))
+        leader = not self.coalescer.in_flight(key)
+        if not leader:
+            timer.count("coalesced", 1)
+
+        async def compute(shared_deadline: Optional[Deadline]) -> Tuple[Optional[str], List[Dict], StageTimer]:
+            shared_timer = StageTimer()
+            content, sources = await self._agenerate(query, scope, "", shared_timer, deadline=shared_deadline)
+            return content, sources, shared_timer
+
+        content, sources, shared_timer = await self.coalescer.do(key, compute, deadline)
+        timer.merge(shared_timer, tokens=leader)
+        return content, sources
+
+    async def abatch_responses(
+        self,
+        questions: List[Dict[str, Any]],
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Answer many questions, yielding each result as soon as it completes.
+
+        All queries are embedded in one batched call; retrieval and LLM calls
+        then run in parallel, capped by the batch concurrency settings.
+        ``deadline`` covers the whole batch: questions still retrieving when
+        it passes get an error, those waiting on the LLM DEADLINE_MESSAGE.
+        """
+        batch_timer = StageTimer()
+        with batch_timer.stage("embed"):
+            vectors = await run_within(
+                deadline, "embed", asyncio.to_thread(self.embed_queries, [q["message"] for q in questions])
+            )
+
+        retrieval_slot = asyncio.Semaphore(self.batch_retrieval_concurrency)
+        llm_slot = asyncio.Semaphore(self.batch_llm_concurrency)
+
+        async def answer(index: int, question: Dict[str, Any], vector: List[float]) -> Dict[str, Any]:
+            timer = StageTimer()
+            timer.timings["embed_ms"] = batch_timer.timings["embed_ms"]
+            scope = self._scope_ids(question.get("documentId"), question.get("documentIds"))
+            try:
+                content, sources = await self._agenerate(
+                    question["message"], scope, "", timer, vector, retrieval_slot, llm_slot, deadline
+                )
+                result = {
+                    "answer": NO_ANSWER_MESSAGE if content is None else self._format_answer(content, sources),
+                    "sources": sources,
+                    "deadline_exceeded": bool(timer.counters.get("deadline_exceeded"))
+                }
+            except Exception as e:
+                logger.error(f"Error answering batch question {index}: {str(e)}")
+                result = {"error": str(e)}
+            timer.mark("total")
+            return {"index": index, "message": question["message"], **result, "timings": timer.timings, "usage": timer.counters}
+
+        tasks = [
+            asyncio.create_task(answer(index, question, vector))
+            for index, (question, vector) in enumerate(zip(questions, vectors))
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Stop outstanding work if the client disconnects mid-batch
+            for task in tasks:
+                task.cancel()
+
+    async def astream_response(
+        self,
+        query: str,
+        document_id: Optional[str] = None,
+        chat_history: Optional[List[Dict]] = None,
+        document_ids: Optional[List[str]] = None,
+        timer: Optional[StageTimer] = None,
+        session_id: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Stream a response as (event, data) pairs: sources, then tokens, then done.
+
+        When ``deadline`` passes during generation the stream ends with the
+        tokens sent so far (or DEADLINE_MESSAGE) and ``deadline_exceeded``.
+        """
+        timer = timer or StageTimer()
+        start = time.perf_counter()
+        scope = self._scope_ids(document_id, document_ids)
+        history = await self._aconversation(session_id, chat_history)
+
+        # Queries naming a known service ID skip vector search entirely
+        sources = self._fast_path_sources(query, scope)
+        if sources:
+            timer.count("fast_path", 1)
+            yield "sources", {"sources": sources}
+            prompt = self._fast_path_prompt(query, sources)
+            if prompt is None:
+                content = self._template_answer(sources)
+                yield "token", {"content": content}
+            else:
+                parts = []
+                try:
+                    with timer.stage("llm"):
+                        async for chunk in iterate_within(deadline, "llm", self.llm.astream(prompt)):
+                            token = getattr(chunk, "content", chunk)
+                            if token:
+                                timer.mark("time_to_first_token")
+                                parts.append(token)
+                                yield "token", {"content": token}
+                except DeadlineExceeded as e:
+                    self._deadline_exceeded(e, timer)
+                    if not parts:
+                        parts.append(self._template_answer(sources))
+                        yield "token", {"content": parts[0]}
+                content = "".join(parts)
+            await self._aremember_turn(session_id, query, content)
+            timer.mark("total")
+            yield "done", {"answer": self._format_answer(content, sources), "timings": timer.timings, "fast_path": True}
+            return
+
+        with timer.stage("retrieval"):
+            vector, cached, retrieved_docs = await self._aretrieve(query, scope, None, timer, not history, deadline)
+
+        if cached is not None:
+            yield "sources", {"sources": cached.sources}
+            yield "token", {"content": cached.answer}
+            await self._aremember_turn(session_id, query, cached.answer)
+            timer.mark("total")
+            yield "done", {"answer": self._format_answer(cached.answer, cached.sources), "timings": timer.timings, "cached": True}
+            return
+
+        with timer.stage("source_parsing"):
+            sources = self._extract_sources(retrieved_docs)
+        yield "sources", {"sources": sources}
+
+        if not sources:
+            timer.mark("total")
+            yield "done", {"answer": NO_ANSWER_MESSAGE, "timings": timer.timings}
+            return
+
+        with timer.stage("prompt_build"):
+            prompt = self._build_prompt(query, retrieved_docs, timer, history)
+        answer_parts = []
+        try:
+            with timer.stage("llm"):
+                async for chunk in iterate_within(deadline, "llm", self.llm.astream(prompt)):
+                    content = getattr(chunk, "content", chunk)
+                    if not content:
+                        continue
+                    timer.mark("time_to_first_token")
+                    answer_parts.append(content)
+                    yield "token", {"content": content}
+        except DeadlineExceeded as e:
+            # Keep what was streamed; a cut-off answer is neither cached nor remembered
+            self._deadline_exceeded(e, timer)
+            content = "".join(answer_parts) or DEADLINE_MESSAGE
+            if not answer_parts:
+                yield "token", {"content": content}
+            timer.mark("total")
+            yield "done", {
+                "answer": self._format_answer(content, sources),
+                "timings": timer.timings,
+                "usage": timer.counters,
+                "deadline_exceeded": True
+            }
+            return
+
+        content = "".join(answer_parts)
+        if not history:
+            self._cache_answer(vector, scope, content, sources, retrieved_docs, start)
+        await self._aremember_turn(session_id, query, content)
+        answer = self._format_answer(content, sources)
+        timer.mark("total")
+        yield "done", {"answer": answer, "timings": timer.timings, "usage": timer.counters}
+
     def cleanup(self) -> None:
         """Cleanup resources."""
-        if hasattr(self, 'client'):
-            self.client.close()
-            logger.info("Weaviate client closed successfully.")
+        self._search_executor.shutdown(wait=False)
+        self._close_vector_store()
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+        if self.shared_state is not None:
+            self.shared_state.close()
+        if self._openai_http_clients is not None:
+            self._openai_http_clients["http_client"].close()
+
+    def _close_vector_store(self) -> None:
+        """Close the vector store connection, if any"""
+        if self.vector_store is not None:
+            self.vector_store.close()
+            self.vector_store = None
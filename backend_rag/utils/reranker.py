@@ -0,0 +1,114 @@
+from typing import Any, Dict, List
+import logging
+import threading
+import time
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """Reorders retrieved chunks with a local CPU cross-encoder.
+
+    All (query, chunk) pairs are scored in a single batched ``predict`` call
+    and only the best ``top_n`` chunks are kept. Under load, when the
+    expected wait for a rerank exceeds ``latency_budget_ms`` or
+    ``max_concurrent`` reranks are already running, reranking is skipped and
+    the first ``top_n`` chunks are returned in retrieval order.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        candidates: int = 20,
+        top_n: int = 4,
+        batch_size: int = 32,
+        latency_budget_ms: float = 150,
+        max_concurrent: int = 2
+    ):
+        self.model_name = model_name
+        self.candidates = candidates
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.latency_budget_ms = latency_budget_ms
+        self.max_concurrent = max_concurrent
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._avg_latency_ms = 0.0
+        self.reranked = 0
+        self.skipped = 0
+        self.failed = False
+
+    def load(self) -> None:
+        """Load the cross-encoder model (done once, on first use or at startup)"""
+        with self._model_lock:
+            if self._model is not None or self.failed:
+                return
+            try:
+                from sentence_transformers import CrossEncoder
+                start = time.perf_counter()
+                self._model = CrossEncoder(self.model_name, device="cpu")
+                logger.info(f"Loaded reranker {self.model_name} in {time.perf_counter() - start:.1f}s")
+            except Exception as e:
+                # Reranking is optional: keep serving in retrieval order
+                self.failed = True
+                logger.error(f"Could not load reranker {self.model_name}, reranking disabled: {str(e)}")
+
+    def _try_acquire(self) -> bool:
+        """Reserve a rerank slot unless that would blow the latency budget"""
+        with self._lock:
+            if self._in_flight > 0:
+                expected_ms = self._avg_latency_ms * (self._in_flight + 1)
+                if self._in_flight >= self.max_concurrent or expected_ms > self.latency_budget_ms:
+                    self.skipped += 1
+                    return False
+            self._in_flight += 1
+            return True
+
+    def _release(self, elapsed_ms: float) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self.reranked += 1
+            # Exponentially weighted moving average of recent rerank latency
+            if self._avg_latency_ms:
+                self._avg_latency_ms = 0.8 * self._avg_latency_ms + 0.2 * elapsed_ms
+            else:
+                self._avg_latency_ms = elapsed_ms
+
+    def rerank(self, query: str, docs: List[Document]) -> List[Document]:
+        """Return the top_n chunks ordered by cross-encoder relevance"""
+        if len(docs) <= 1:
+            return docs[:self.top_n]
+
+        self.load()
+        if self._model is None or not self._try_acquire():
+            return docs[:self.top_n]
+
+        start = time.perf_counter()
+        try:
+            scores = self._model.predict(
+                [(query, doc.page_content) for doc in docs],
+                batch_size=self.batch_size,
+                show_progress_bar=False
+            )
+        except Exception as e:
+            logger.error(f"Reranking failed, keeping retrieval order: {str(e)}")
+            return docs[:self.top_n]
+        finally:
+            self._release((time.perf_counter() - start) * 1000)
+
+        for doc, score in zip(docs, scores):
+            doc.metadata["rerank_score"] = float(score)
+        return sorted(docs, key=lambda doc: doc.metadata["rerank_score"], reverse=True)[:self.top_n]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "reranked": self.reranked,
+                "skipped": self.skipped,
+                "avg_latency_ms": round(self._avg_latency_ms, 2),
+                "enabled": not self.failed
+            }
@@ -0,0 +1,365 @@
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, TypeVar
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from utils.deadline import DeadlineExceeded, current_deadline
+from utils.metrics import CIRCUIT_STATE, UPSTREAM_CALLS, UPSTREAM_IN_FLIGHT, UPSTREAM_POOL_SIZE
+from utils.vector_store import StoredChunk, VectorStore
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Exception classes (matched by name, so neither openai nor weaviate has to be
+# imported here) that mean the upstream was unreachable, slow or overloaded
+TRANSIENT_ERRORS = {
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+    "WeaviateConnectionError", "WeaviateTimeoutError", "WeaviateGRPCUnavailableError",
+    "TransportError",
+}
+
+# A call failing this close to (or after) the request deadline (seconds) was
+# cut short by the timeout derived from the deadline
+DEADLINE_SLACK = 0.01
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed call may succeed when retried"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code == 429 or status_code >= 500
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} is unavailable, retry in {retry_after:.0f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fails fast after ``failure_threshold`` consecutive transient failures.
+
+    The circuit then stays open for ``reset_timeout`` seconds, after which a
+    single trial call is let through (half-open): success closes the circuit,
+    failure opens it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+    STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(upstream=name).set(self.state)
+
+    def _set_state(self, state: int) -> None:
+        if state != self.state:
+            logger.warning(f"Circuit breaker {self.name}: {self.STATE_NAMES[self.state]} -> {self.STATE_NAMES[state]}")
+        self.state = state
+        CIRCUIT_STATE.labels(upstream=self.name).set(state)
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self._set_state(self.HALF_OPEN)
+                self._trial_running = False
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+            raise CircuitOpenError(self.name, max(remaining, 1.0))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def record_release(self) -> None:
+        """A call ended without telling anything about the upstream's health"""
+        with self._lock:
+            self._trial_running = False
+
+
+class Upstream:
+    """Calls to one upstream service, guarded by a circuit breaker.
+
+    Idempotent calls that fail with a transient error are retried up to
+    ``attempts`` times in total, with full-jitter exponential backoff
+    (a random delay up to ``base_delay * 2**n``, capped at ``max_delay``),
+    unless the request deadline (utils.deadline) would pass first.
+    Calls made with ``timeout_arg`` get that keyword set to ``timeout``,
+    shortened to what is left of the deadline, so an abandoned request does
+    not hold a connection for the full client timeout. Calls in flight are
+    exported next to the connection pool size.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pool_size: Optional[int] = None,
+        attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        timeout: Optional[float] = None
+    ):
+        self.name = name
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.in_flight = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+        self._in_flight_gauge = UPSTREAM_IN_FLIGHT.labels(upstream=name)
+        if pool_size:
+            UPSTREAM_POOL_SIZE.labels(upstream=name).set(pool_size)
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call_timeout(self) -> Optional[float]:
+        """Timeout of the next attempt: the configured one, capped by the remaining deadline"""
+        deadline = current_deadline()
+        if deadline is None:
+            return self.timeout
+        return deadline.remaining() if self.timeout is None else min(self.timeout, deadline.remaining())
+
+    def _with_timeout(self, kwargs: Dict[str, Any], timeout_arg: Optional[str]) -> Dict[str, Any]:
+        timeout = self.call_timeout() if timeout_arg else None
+        return kwargs if timeout is None else {**kwargs, timeout_arg: timeout}
+
+    def _before_attempt(self) -> None:
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded(self.name)
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._rejected()
+            raise
+
+    def _enter(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+        self._in_flight_gauge.inc()
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._in_flight_gauge.dec()
+
+    def _failed(self, error: Exception, attempt: int, idempotent: bool) -> bool:
+        """Record a failed attempt; returns True when it should be retried"""
+        if not is_transient(error):
+            self.breaker.record_release()
+            UPSTREAM_CALLS.labels(upstream=self.name, outcome="error").inc()
+            return False
+        deadline = current_deadline()
+        if deadline is not None and deadline.remaining() <= DEADLINE_SLACK:
+            # Cut short by the request's own deadline, which says nothing about the upstream
+            self.breaker.record_release()
+            UPSTREAM_CALLS.labels(upstream=self.name, outcome="deadline_exceeded").inc()
+            raise DeadlineExceeded(self.name) from error
+        self.breaker.record_failure()
+        retry = (
+            idempotent
+            and attempt + 1 < self.attempts
+            and self.breaker.state != CircuitBreaker.OPEN
+            and (deadline is None or deadline.remaining() > self.max_delay)
+        )
+        UPSTREAM_CALLS.labels(upstream=self.name, outcome="retry" if retry else "error").inc()
+        if retry:
+            with self._lock:
+                self.retries += 1
+            logger.warning(f"{self.name} call failed ({type(error).__name__}: {str(error)}), retrying")
+        return retry
+
+    def _rejected(self) -> None:
+        UPSTREAM_CALLS.labels(upstream=self.name, outcome="rejected").inc()
+
+    def call(self, fn: Callable[..., T], *args: Any, idempotent: bool = True, timeout_arg: Optional[str] = None, **kwargs: Any) -> T:
+        for attempt in range(self.attempts):
+            self._before_attempt()
+            self._enter()
+            try:
+                result = fn(*args, **self._with_timeout(kwargs, timeout_arg))
+            except Exception as e:
+                if not self._failed(e, attempt, idempotent):
+                    raise
+            else:
+                self.breaker.record_success()
+                UPSTREAM_CALLS.labels(upstream=self.name, outcome="success").inc()
+                return result
+            finally:
+                self._exit()
+            time.sleep(self.backoff(attempt))
+
+    async def acall(self, fn: Callable[..., Any], *args: Any, idempotent: bool = True, timeout_arg: Optional[str] = None, **kwargs: Any) -> Any:
+        for attempt in range(self.attempts):
+            self._before_attempt()
+            self._enter()
+            try:
+                result = await fn(*args, **self._with_timeout(kwargs, timeout_arg))
+            except asyncio.CancelledError:
+                self.breaker.record_release()
+                raise
+            except Exception as e:
+                if not self._failed(e, attempt, idempotent):
+                    raise
+            else:
+                self.breaker.record_success()
+                UPSTREAM_CALLS.labels(upstream=self.name, outcome="success").inc()
+                return result
+            finally:
+                self._exit()
+            await asyncio.sleep(self.backoff(attempt))
+
+    async def astream(self, fn: Callable[..., AsyncIterator[T]], *args: Any, timeout_arg: Optional[str] = None, **kwargs: Any) -> AsyncIterator[T]:
+        """Stream through the breaker; retried only while nothing has been yielded yet"""
+        for attempt in range(self.attempts):
+            self._before_attempt()
+            self._enter()
+            started = False
+            try:
+                async for item in fn(*args, **self._with_timeout(kwargs, timeout_arg)):
+                    started = True
+                    yield item
+            except (asyncio.CancelledError, GeneratorExit):
+                self.breaker.record_release()
+                raise
+            except Exception as e:
+                if not self._failed(e, attempt, idempotent=not started):
+                    raise
+            else:
+                self.breaker.record_success()
+                UPSTREAM_CALLS.labels(upstream=self.name, outcome="success").inc()
+                return
+            finally:
+                self._exit()
+            await asyncio.sleep(self.backoff(attempt))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "pool_size": self.pool_size,
+            "pool_utilization": self.in_flight / self.pool_size if self.pool_size else None,
+            "retries": self.retries,
+            "circuit_state": self.breaker.state,
+            "circuit_opened": self.breaker.opened
+        }
+
+
+class ResilientEmbeddings:
+    """Embeddings client whose calls go through an Upstream"""
+
+    def __init__(self, embeddings: Any, upstream: Upstream):
+        self.embeddings = embeddings
+        self.upstream = upstream
+        self.model = getattr(embeddings, "model", "default")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.upstream.call(self.embeddings.embed_query, text, timeout_arg="timeout")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.upstream.call(self.embeddings.embed_documents, texts, timeout_arg="timeout")
+
+
+class ResilientLLM:
+    """Chat model whose calls go through an Upstream (generation has no side effects, so it is retried)"""
+
+    def __init__(self, llm: Any, upstream: Upstream):
+        self.llm = llm
+        self.upstream = upstream
+
+    def invoke(self, prompt: Any) -> Any:
+        return self.upstream.call(self.llm.invoke, prompt, timeout_arg="timeout")
+
+    async def ainvoke(self, prompt: Any) -> Any:
+        return await self.upstream.acall(self.llm.ainvoke, prompt, timeout_arg="timeout")
+
+    def astream(self, prompt: Any) -> AsyncIterator[Any]:
+        return self.upstream.astream(self.llm.astream, prompt, timeout_arg="timeout")
+
+
+class ResilientVectorStore(VectorStore):
+    """Vector store whose calls go through an Upstream.
+
+    Everything but ``insert`` is idempotent and retried; an insert is not,
+    since a retry after a lost response would store the chunk twice.
+    """
+
+    def __init__(self, store: VectorStore, upstream: Upstream):
+        self.store = store
+        self.upstream = upstream
+        self.shared = store.shared
+
+    def connect(self) -> None:
+        self.upstream.call(self.store.connect)
+
+    def is_connected(self) -> bool:
+        return self.store.is_connected()
+
+    def is_ready(self) -> bool:
+        return self.store.is_ready()
+
+    def close(self) -> None:
+        self.store.close()
+
+    def insert(self, properties: Dict[str, Any]) -> str:
+        return self.upstream.call(self.store.insert, properties, idempotent=False)
+
+    def update(self, chunk_uuid: str, properties: Dict[str, Any], vector: Optional[List[float]] = None) -> None:
+        self.upstream.call(self.store.update, chunk_uuid, properties, vector=vector)
+
+    def delete_document(self, document_id: str) -> int:
+        return self.upstream.call(self.store.delete_document, document_id)
+
+    def near_vector(self, vector: List[float], document_ids: List[str], limit: int) -> List[StoredChunk]:
+        return self.upstream.call(self.store.near_vector, vector, document_ids, limit)
+
+    def bm25(self, query: str, document_ids: List[str], limit: int) -> List[StoredChunk]:
+        return self.upstream.call(self.store.bm25, query, document_ids, limit)
+
+    def fetch_document(self, document_id: str, limit: int) -> List[StoredChunk]:
+        return self.upstream.call(self.store.fetch_document, document_id, limit)
+
+    def iterate(self, properties: Optional[List[str]] = None, include_vector: bool = False) -> Iterator[StoredChunk]:
+        # A scan is consumed lazily, after this returns; it bypasses the upstream
+        return self.store.iterate(properties=properties, include_vector=include_vector)
+
+    def count(self) -> int:
+        return self.upstream.call(self.store.count)
@@ -0,0 +1,71 @@
+from typing import Any, Dict, List
+import re
+
+from langchain_core.documents import Document
+
+_TERM = re.compile(r"\w{2,}")
+
+
+def _doc_key(doc: Document) -> str:
+    """Stable identity of a retrieved chunk across result lists"""
+    return doc.metadata.get("uuid") or doc.page_content
+
+
+def reciprocal_rank_fusion(
+    vector_docs: List[Document],
+    keyword_docs: List[Document],
+    alpha: float = 0.5,
+    k: int = 60,
+    limit: int = 4
+) -> List[Document]:
+    """Fuse dense and BM25 rankings with weighted reciprocal-rank fusion.
+
+    Each chunk scores ``alpha / (k + vector_rank) + (1 - alpha) / (k + keyword_rank)``
+    (ranks start at 1, a missing rank contributes nothing), so ``alpha=1`` is
+    pure vector search and ``alpha=0`` pure keyword search. A larger ``k``
+    flattens the advantage of the top ranks.
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+
+    for weight, ranked in ((alpha, vector_docs), (1 - alpha, keyword_docs)):
+        for rank, doc in enumerate(ranked, 1):
+            key = _doc_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+
+    fused = []
+    for key in sorted(scores, key=scores.get, reverse=True)[:limit]:
+        doc = docs[key]
+        doc.metadata["fusion_score"] = scores[key]
+        fused.append(doc)
+    return fused
+
+
+def highlight(text: str, query: str, max_snippets: int = 3, window: int = 60) -> Dict[str, Any]:
+    """Locate the query terms in a passage.
+
+    Returns the character offsets of every match and up to ``max_snippets``
+    snippets of surrounding text with the matches wrapped in ``<mark>``.
+    """
+    terms = sorted({term.lower() for term in _TERM.findall(query)}, key=len, reverse=True)
+    if not terms:
+        return {"matches": [], "snippets": []}
+
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+    matches = [(m.start(), m.end()) for m in pattern.finditer(text)]
+
+    snippets = []
+    covered_until = -1
+    for start, end in matches:
+        if start < covered_until:
+            continue
+        snippet_start = max(0, start - window)
+        snippet_end = min(len(text), end + window)
+        covered_until = snippet_end
+        snippet = pattern.sub(lambda m: f"<mark>{m.group(0)}</mark>", text[snippet_start:snippet_end])
+        snippets.append(("…" if snippet_start else "") + snippet + ("…" if snippet_end < len(text) else ""))
+        if len(snippets) >= max_snippets:
+            break
+
+    return {"matches": [list(match) for match in matches], "snippets": snippets}
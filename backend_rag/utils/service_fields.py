@@ -0,0 +1,26 @@
+from typing import Dict
+
+# Line prefixes of the service catalog entries and the property each one fills
+SERVICE_FIELD_PREFIXES = {
+    "ID:": "service_id",
+    "Lien EN:": "url",
+    "Nom du service EN:": "service_name",
+    "DESCRIPTION EN EN:": "description",
+}
+
+SERVICE_FIELDS = ("service_id", "service_name", "url", "description")
+
+
+def parse_service_fields(text: str) -> Dict[str, str]:
+    """Extract the structured service fields from a catalog chunk.
+
+    Every field is always present; fields missing from the text are empty
+    strings, so a parsed chunk can be told apart from one never parsed.
+    """
+    fields = {name: "" for name in SERVICE_FIELDS}
+    for line in text.split("\n"):
+        for prefix, name in SERVICE_FIELD_PREFIXES.items():
+            if line.startswith(prefix):
+                fields[name] = line[len(prefix):].strip()
+                break
+    return fields
@@ -0,0 +1,82 @@
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Tokens that contain at least one digit, e.g. "SRV-1042", "12345", "A7.3"
+DEFAULT_ID_PATTERN = r"[A-Za-z0-9][A-Za-z0-9_\-./]*\d[A-Za-z0-9_\-./]*|\d+"
+
+
+class ServiceIndex:
+    """Exact service-ID index mapping each id to the chunks that describe it.
+
+    Lookups are dictionary hits, so queries that name a service ID can be
+    answered without a vector search.
+    """
+
+    def __init__(self, id_pattern: str = DEFAULT_ID_PATTERN):
+        self._id_pattern = re.compile(id_pattern)
+        self._records: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.fast_path_hits = 0
+
+    @staticmethod
+    def _normalize(service_id: str) -> str:
+        return service_id.strip().casefold()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        """Index a service record (needs at least service_id and document_id)"""
+        service_id = record.get("service_id")
+        if not service_id:
+            return
+        with self._lock:
+            self._records.setdefault(self._normalize(service_id), {})[record.get("document_id", "")] = record
+
+    def load(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Rebuild the index from stored records"""
+        rebuilt: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for record in records:
+            if record.get("service_id"):
+                rebuilt.setdefault(self._normalize(record["service_id"]), {})[record.get("document_id", "")] = record
+        with self._lock:
+            self._records = rebuilt
+        return len(rebuilt)
+
+    def remove_document(self, document_id: str) -> None:
+        """Drop every record that came from the document"""
+        with self._lock:
+            for service_id in list(self._records):
+                self._records[service_id].pop(document_id, None)
+                if not self._records[service_id]:
+                    del self._records[service_id]
+
+    def find(self, query: str, document_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Return the records of every indexed service ID mentioned in the query"""
+        matches = []
+        seen = set()
+        with self._lock:
+            self.lookups += 1
+            for token in self._id_pattern.findall(query):
+                service_id = self._normalize(token.rstrip(".-/"))
+                if service_id in seen:
+                    continue
+                seen.add(service_id)
+                for document_id, record in self._records.get(service_id, {}).items():
+                    if document_ids and document_id not in document_ids:
+                        continue
+                    matches.append(record)
+                    break
+            if matches:
+                self.fast_path_hits += 1
+        return matches
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "service_ids": len(self._records),
+                "lookups": self.lookups,
+                "fast_path_hits": self.fast_path_hits
+            }
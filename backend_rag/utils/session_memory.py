@@ -0,0 +1,233 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+Turn = Tuple[str, str]
+
+
+@dataclass
+class Session:
+    summary: str = ""
+    turns: List[Turn] = field(default_factory=list)
+    pending: List[Turn] = field(default_factory=list)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+def format_turns(turns: List[Turn]) -> str:
+    return "\n".join(f"User: {question}\nAssistant: {answer}" for question, answer in turns)
+
+
+def fallback_summary(summary: str, turns: List[Turn], answer_chars: int = 160) -> str:
+    """Summary without a summarizer: each question with the start of its answer"""
+    parts = [summary] if summary else []
+    for question, answer in turns:
+        snippet = " ".join(answer.split())
+        if len(snippet) > answer_chars:
+            snippet = snippet[:answer_chars].rsplit(" ", 1)[0] + "..."
+        parts.append(f"Q: {question} A: {snippet}")
+    return " ".join(parts)
+
+
+class SessionMemoryStore:
+    """Bounded conversation memory per session id.
+
+    Each session keeps its last ``max_turns`` turns verbatim, trimmed further
+    so that the summary and the verbatim turns stay within ``max_tokens``.
+    Older turns wait in ``pending`` (rendered only in the budget left, at
+    most ``max_turns`` of them) until compact() folds them into a running
+    summary by ``summarizer``, or into question/answer snippets when there
+    is none.
+    Sessions idle for ``ttl_seconds`` are evicted, and at most
+    ``max_sessions`` are kept, least recently used first out.
+
+    With a ``shared`` store (utils.shared_state.SharedStateStore) sessions are
+    read from it on every access and written back after every change, so a
+    conversation can move between worker processes; the last write wins.
+    """
+
+    def __init__(
+        self,
+        max_turns: int = 6,
+        max_tokens: int = 800,
+        ttl_seconds: float = 1800,
+        max_sessions: int = 10000,
+        count_tokens: Callable[[str], int] = lambda text: (len(text) + 3) // 4,
+        summarizer: Optional[Callable[[str, List[Turn]], str]] = None,
+        shared: Optional[Any] = None
+    ):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.count_tokens = count_tokens
+        self.summarizer = summarizer
+        self.shared = shared
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_eviction = time.monotonic()
+        self.evicted = 0
+        self.summarized_turns = 0
+
+    def _evict_idle(self, now: float) -> None:
+        """Drop expired sessions (at most once a minute) and enforce max_sessions"""
+        if now - self._last_eviction >= 60:
+            self._last_eviction = now
+            for session_id in [s for s, session in self._sessions.items() if now - session.last_used > self.ttl_seconds]:
+                del self._sessions[session_id]
+                self.evicted += 1
+            if self.shared is not None:
+                try:
+                    self.shared.delete_expired_sessions(self.ttl_seconds)
+                except Exception as e:
+                    logger.warning(f"Could not expire shared sessions: {str(e)}")
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def _session(self, session_id: str) -> Session:
+        now = time.monotonic()
+        self._evict_idle(now)
+        session = self._sessions.get(session_id)
+        if session is None or now - session.last_used > self.ttl_seconds:
+            session = Session()
+            self._sessions[session_id] = session
+        if self.shared is not None:
+            # Another worker may have served the previous turns
+            try:
+                stored = self.shared.load_session(session_id, self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"Could not load shared session {session_id}: {str(e)}")
+                stored = None
+            if stored is not None:
+                session.summary, session.turns, session.pending = stored[0], list(stored[1]), list(stored[2])
+        session.last_used = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _save(self, session_id: str, session: Session) -> None:
+        if self.shared is None:
+            return
+        try:
+            self.shared.save_session(session_id, session.summary, session.turns, session.pending)
+        except Exception as e:
+            logger.warning(f"Could not save shared session {session_id}: {str(e)}")
+
+    def _trim(self, session: Session) -> None:
+        """Move the oldest turns to pending until summary and verbatim turns fit their bounds"""
+        while len(session.turns) > self.max_turns or (
+            len(session.turns) > 1 and self.count_tokens(self._render_kept(session)) > self.max_tokens
+        ):
+            session.pending.append(session.turns.pop(0))
+        # Compaction runs in the background and may fall behind; fold the
+        # overflow into the summary right away instead of letting it pile up
+        overflow = len(session.pending) - self.max_turns
+        if overflow > 0:
+            folded = session.pending[:overflow]
+            del session.pending[:overflow]
+            session.summary = self._cap_summary(fallback_summary(session.summary, folded))
+            self.summarized_turns += overflow
+
+    def _cap_summary(self, summary: str) -> str:
+        # Keep the summary to at most half of the history budget
+        return summary[-self.max_tokens * 2:]
+
+    def _fit(self, text: str, max_tokens: int) -> str:
+        """Cut the start of ``text`` (the oldest part) until it fits in ``max_tokens``"""
+        tokens = self.count_tokens(text)
+        while text and tokens > max_tokens:
+            keep = int(len(text) * max_tokens / tokens) - 1
+            text = text[-keep:] if keep > 0 else ""
+            tokens = self.count_tokens(text)
+        return text
+
+    @staticmethod
+    def _summary_text(session: Session) -> str:
+        return f"Summary of earlier conversation: {session.summary}" if session.summary else ""
+
+    def _render_kept(self, session: Session) -> str:
+        return "\n".join(part for part in (self._summary_text(session), format_turns(session.turns)) if part)
+
+    def _render(self, session: Session) -> str:
+        """Summary, the pending turns that fit in the budget left, then the verbatim turns"""
+        budget = self.max_tokens - self.count_tokens(self._render_kept(session))
+        pending: List[Turn] = []
+        for turn in reversed(session.pending):
+            if self.count_tokens(format_turns([turn, *pending])) > budget:
+                break
+            pending.insert(0, turn)
+        parts = (self._summary_text(session), format_turns(pending), format_turns(session.turns))
+        # A single verbatim turn may still exceed the budget on its own
+        return self._fit("\n".join(part for part in parts if part), self.max_tokens)
+
+    def bounded(self, turns: List[Turn]) -> str:
+        """History for a request without a session: its last turns within max_turns and max_tokens"""
+        kept = list(turns[-self.max_turns:])
+        while len(kept) > 1 and self.count_tokens(format_turns(kept)) > self.max_tokens:
+            kept.pop(0)
+        return self._fit(format_turns(kept), self.max_tokens)
+
+    def seed(self, session_id: str, turns: List[Turn]) -> None:
+        """Initialise an empty session from client-side history"""
+        with self._lock:
+            session = self._session(session_id)
+            if session.turns or session.summary or session.pending:
+                return
+            session.turns = list(turns)
+            self._trim(session)
+            self._save(session_id, session)
+
+    def history(self, session_id: str) -> str:
+        """Summary and recent turns of the session, ready for the prompt"""
+        with self._lock:
+            return self._render(self._session(session_id))
+
+    def add_turn(self, session_id: str, question: str, answer: str) -> bool:
+        """Record a turn; returns True when older turns are waiting to be summarized"""
+        with self._lock:
+            session = self._session(session_id)
+            session.turns.append((question, answer))
+            self._trim(session)
+            self._save(session_id, session)
+            return bool(session.pending)
+
+    def compact(self, session_id: str) -> None:
+        """Fold turns that fell out of the window into the running summary"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or not session.pending:
+                return
+            summary, pending = session.summary, list(session.pending)
+
+        new_summary = None
+        if self.summarizer is not None:
+            try:
+                new_summary = self.summarizer(summary, pending)
+            except Exception as e:
+                logger.warning(f"Summarizing session {session_id} failed, truncating instead: {str(e)}")
+        if not new_summary:
+            new_summary = fallback_summary(summary, pending)
+
+        with self._lock:
+            # The summarizer ran unlocked: the session may have been replaced,
+            # reloaded or compacted meanwhile, so only apply to what is unchanged
+            session = self._sessions.get(session_id)
+            if session is None or session.summary != summary or session.pending[:len(pending)] != pending:
+                logger.info(f"Session {session_id} changed while summarizing, dropping the summary")
+                return
+            session.summary = self._cap_summary(new_summary)
+            del session.pending[:len(pending)]
+            self.summarized_turns += len(pending)
+            self._save(session_id, session)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "evicted": self.evicted,
+                "summarized_turns": self.summarized_turns
+            }
@@ -0,0 +1,128 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+Turn = Tuple[str, str]
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS documents ("
+    "id TEXT PRIMARY KEY, info TEXT NOT NULL, file_path TEXT, uploaded_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS document_events ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, document_id TEXT NOT NULL, "
+    "file_path TEXT, worker INTEGER NOT NULL, created_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS sessions ("
+    "id TEXT PRIMARY KEY, summary TEXT NOT NULL, turns TEXT NOT NULL, pending TEXT NOT NULL, "
+    "updated_at REAL NOT NULL)",
+)
+
+
+class SharedStateStore:
+    """State shared by the worker processes of one deployment, in a SQLite (WAL) file.
+
+    Holds the document catalog, a log of document changes that workers
+    replay to invalidate their in-process caches, and conversation sessions.
+    Every worker opens its own connection to the same file.
+    """
+
+    def __init__(self, path: str, event_retention_seconds: float = 3600):
+        self.path = Path(path)
+        self.event_retention_seconds = event_retention_seconds
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        logger.info(f"Sharing worker state through {self.path}")
+
+    def _execute(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    # Document catalog
+
+    def upsert_document(self, info: Dict[str, Any], file_path: Optional[str] = None) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO documents (id, info, file_path, uploaded_at) VALUES (?, ?, ?, ?)",
+            (info["id"], json.dumps(info, ensure_ascii=False), file_path, info.get("uploadedAt", time.time()))
+        )
+
+    def remove_document(self, document_id: str) -> None:
+        self._execute("DELETE FROM documents WHERE id = ?", (document_id,))
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        """Catalog entries, newest first"""
+        rows = self._execute("SELECT info FROM documents ORDER BY uploaded_at DESC").fetchall()
+        return [json.loads(info) for info, in rows]
+
+    def document_files(self) -> List[Tuple[str, Optional[str]]]:
+        """(document id, uploaded file path) of every catalog entry"""
+        return self._execute("SELECT id, file_path FROM documents ORDER BY uploaded_at").fetchall()
+
+    # Document change log
+
+    def publish(self, kind: str, document_id: str, worker: int, file_path: Optional[str] = None) -> None:
+        """Record that a document was updated or deleted by ``worker``"""
+        now = time.time()
+        self._execute(
+            "INSERT INTO document_events (kind, document_id, file_path, worker, created_at) VALUES (?, ?, ?, ?, ?)",
+            (kind, document_id, file_path, worker, now)
+        )
+        if now - self._last_prune > 60:
+            self._last_prune = now
+            self._execute("DELETE FROM document_events WHERE created_at < ?", (now - self.event_retention_seconds,))
+
+    def last_event_id(self) -> int:
+        row = self._execute("SELECT MAX(id) FROM document_events").fetchone()
+        return row[0] or 0
+
+    def events_since(self, event_id: int) -> List[Dict[str, Any]]:
+        rows = self._execute(
+            "SELECT id, kind, document_id, file_path, worker FROM document_events WHERE id > ? ORDER BY id",
+            (event_id,)
+        ).fetchall()
+        return [
+            {"id": row[0], "kind": row[1], "document_id": row[2], "file_path": row[3], "worker": row[4]}
+            for row in rows
+        ]
+
+    # Conversation sessions
+
+    def load_session(self, session_id: str, ttl_seconds: float) -> Optional[Tuple[str, List[Turn], List[Turn]]]:
+        """(summary, turns, pending) of a session used within ``ttl_seconds``, else None"""
+        row = self._execute(
+            "SELECT summary, turns, pending FROM sessions WHERE id = ? AND updated_at >= ?",
+            (session_id, time.time() - ttl_seconds)
+        ).fetchone()
+        if row is None:
+            return None
+        summary, turns, pending = row
+        return summary, [tuple(turn) for turn in json.loads(turns)], [tuple(turn) for turn in json.loads(pending)]
+
+    def save_session(self, session_id: str, summary: str, turns: List[Turn], pending: List[Turn]) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO sessions (id, summary, turns, pending, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (session_id, summary, json.dumps(turns, ensure_ascii=False), json.dumps(pending, ensure_ascii=False), time.time())
+        )
+
+    def delete_expired_sessions(self, ttl_seconds: float) -> int:
+        return self._execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - ttl_seconds,)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": self._execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+            "sessions": self._execute("SELECT COUNT(*) FROM sessions").fetchone()[0],
+            "last_event_id": self.last_event_id()
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
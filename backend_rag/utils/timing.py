@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator
+import time
+
+
+class StageTimer:
+    """Collects wall-clock timings (in milliseconds) and counts for the stages of one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+    def elapsed_ms(self) -> float:
+        """Milliseconds since the timer was created"""
+        return (time.perf_counter() - self.start) * 1000
+
+    def mark(self, name: str) -> float:
+        """Record the time elapsed since the start of the request under `name`"""
+        elapsed = round(self.elapsed_ms(), 2)
+        self.timings.setdefault(f"{name}_ms", elapsed)
+        return elapsed
+
+    def count(self, name: str, value: int) -> None:
+        """Record a per-request count such as prompt tokens"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block and record it as `<name>_ms`"""
+        stage_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[f"{name}_ms"] = round((time.perf_counter() - stage_start) * 1000, 2)
+
+    def merge(self, other: "StageTimer", tokens: bool = True) -> None:
+        """Add the timings and counts recorded by ``other`` (e.g. for shared work) to this timer.
+
+        ``tokens=False`` leaves out the token counts, for a request that only
+        shared an LLM call another request is accounted for.
+        """
+        self.timings.update(other.timings)
+        for name, value in other.counters.items():
+            if tokens or not name.endswith("_tokens"):
+                self.count(name, value)
@@ -0,0 +1,511 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import logging
+import math
+import re
+import threading
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StoredChunk:
+    """A chunk returned by a vector store, with its search distance or score when it came from a query"""
+    uuid: str
+    properties: Dict[str, Any]
+    vector: Optional[List[float]] = None
+    distance: Optional[float] = None
+    score: Optional[float] = None
+
+
+class VectorStore:
+    """Chunk storage and search used by RAGProcessor.
+
+    Chunks are dicts of properties ("text", "document_id", page and line
+    numbers, service fields); the store computes their vectors on insert.
+    Every search can be restricted to a list of document ids. ``shared``
+    tells whether every worker process sees the same chunks.
+    """
+
+    shared = False
+
+    def connect(self) -> None:
+        raise NotImplementedError
+
+    def is_connected(self) -> bool:
+        """Cheap local check of the connection state"""
+        raise NotImplementedError
+
+    def is_ready(self) -> bool:
+        """Full readiness probe (may be a network call)"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+    def insert(self, properties: Dict[str, Any]) -> str:
+        raise NotImplementedError
+
+    def update(self, chunk_uuid: str, properties: Dict[str, Any], vector: Optional[List[float]] = None) -> None:
+        """Update properties of a chunk; passing its vector avoids re-vectorizing it"""
+        raise NotImplementedError
+
+    def delete_document(self, document_id: str) -> int:
+        """Delete every chunk of a document, returning how many were deleted"""
+        raise NotImplementedError
+
+    def near_vector(self, vector: List[float], document_ids: List[str], limit: int) -> List[StoredChunk]:
+        """Nearest chunks by cosine distance"""
+        raise NotImplementedError
+
+    def bm25(self, query: str, document_ids: List[str], limit: int) -> List[StoredChunk]:
+        """Best chunks by BM25 keyword score"""
+        raise NotImplementedError
+
+    def fetch_document(self, document_id: str, limit: int) -> List[StoredChunk]:
+        """All chunks of a document, with their vectors"""
+        raise NotImplementedError
+
+    def iterate(self, properties: Optional[List[str]] = None, include_vector: bool = False) -> Iterator[StoredChunk]:
+        """Iterate over every stored chunk"""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class WeaviateVectorStore(VectorStore):
+    """Chunks stored in a Weaviate Cloud collection, vectorized server-side with text2vec-openai.
+
+    Document filters are exact only when document_id uses field tokenization
+    (collections created by this class). Older collections tokenize it into
+    words, so a filter on "SRV-1" also matches other ids sharing its tokens;
+    there results are re-checked against the exact id, which may return fewer
+    than ``limit`` chunks. Older collections also lack the typed service
+    fields until backfill_service_fields.py has run, so run it before trusting
+    scoped retrieval on them, and recreate the collection for exact filtering.
+    """
+
+    shared = True
+
+    def __init__(
+        self,
+        cluster_url: str,
+        api_key: str,
+        openai_api_key: str,
+        collection_name: str = "DocumentChunks",
+        query_timeout: float = 30.0,
+        insert_timeout: float = 90.0,
+        pool_size: int = 20
+    ):
+        self.cluster_url = cluster_url
+        self.api_key = api_key
+        self.openai_api_key = openai_api_key
+        self.collection_name = collection_name
+        self.query_timeout = query_timeout
+        self.insert_timeout = insert_timeout
+        self.pool_size = pool_size
+        self.client = None
+        self.collection = None
+        self.exact_document_filter = True
+
+    def connect(self) -> None:
+        import weaviate
+        from weaviate.classes.init import AdditionalConfig, Auth, Timeout
+        from weaviate.config import ConnectionConfig
+
+        self.client = weaviate.connect_to_weaviate_cloud(
+            cluster_url=self.cluster_url,
+            auth_credentials=Auth.api_key(self.api_key),
+            headers={'X-OpenAI-Api-Key': self.openai_api_key},
+            additional_config=AdditionalConfig(
+                connection=ConnectionConfig(session_pool_connections=self.pool_size, session_pool_maxsize=self.pool_size),
+                timeout=Timeout(init=5, query=self.query_timeout, insert=self.insert_timeout)
+            )
+        )
+        self._initialize_collection()
+
+    def is_connected(self) -> bool:
+        return self.client is not None and self.client.is_connected()
+
+    def is_ready(self) -> bool:
+        return self.client is not None and self.client.is_ready()
+
+    def close(self) -> None:
+        if self.client is not None:
+            try:
+                self.client.close()
+                logger.info("Weaviate client closed successfully.")
+            except Exception as e:
+                logger.error(f"Error closing Weaviate client: {str(e)}")
+            self.client = None
+            self.collection = None
+
+    def _initialize_collection(self) -> None:
+        """Initialize or get the Weaviate collection."""
+        from weaviate.classes import config as wvc
+
+        try:
+            if self.client.collections.exists(self.collection_name):
+                self.collection = self.client.collections.get(self.collection_name)
+                logger.info(f"Using existing collection: {self.collection_name}")
+                self._check_schema()
+            else:
+                # Create new collection with properties
+                self.collection = self.client.collections.create(
+                    name=self.collection_name,
+                    vectorizer_config=wvc.Configure.Vectorizer.text2vec_openai(),
+                    generative_config=wvc.Configure.Generative.openai(),
+                    properties=[
+                        wvc.Property(name="text", data_type=wvc.DataType.TEXT),
+                        # Field tokenization keeps the whole id as one token so
+                        # document filters are exact matches on the inverted index
+                        wvc.Property(
+                            name="document_id",
+                            data_type=wvc.DataType.TEXT,
+                            tokenization=wvc.Tokenization.FIELD,
+                            index_filterable=True
+                        ),
+                        wvc.Property(name="page", data_type=wvc.DataType.INT),
+                        wvc.Property(name="start_line", data_type=wvc.DataType.INT),
+                        wvc.Property(name="end_line", data_type=wvc.DataType.INT),
+                        wvc.Property(name="section_title", data_type=wvc.DataType.TEXT),
+                        wvc.Property(name="file_name", data_type=wvc.DataType.TEXT),
+                        *self._service_properties(),
+                    ]
+                )
+                logger.info(f"Created new collection: {self.collection_name}")
+        except Exception as e:
+            logger.error(f"Failed to initialize collection: {e}")
+            raise
+
+    @staticmethod
+    def _service_properties() -> List[Any]:
+        """Typed service fields extracted at ingest time.
+
+        They are not vectorized, so chunk vectors stay based on the text alone.
+        """
+        from weaviate.classes import config as wvc
+
+        return [
+            wvc.Property(
+                name="service_id",
+                data_type=wvc.DataType.TEXT,
+                tokenization=wvc.Tokenization.FIELD,
+                index_filterable=True,
+                skip_vectorization=True
+            ),
+            wvc.Property(name="service_name", data_type=wvc.DataType.TEXT, skip_vectorization=True),
+            wvc.Property(name="url", data_type=wvc.DataType.TEXT, skip_vectorization=True),
+            wvc.Property(name="description", data_type=wvc.DataType.TEXT, skip_vectorization=True),
+        ]
+
+    def _check_schema(self) -> None:
+        """Validate an existing collection and add properties introduced since it was created"""
+        from weaviate.classes import config as wvc
+
+        try:
+            properties = {p.name: p for p in self.collection.config.get().properties}
+
+            # Warn when the collection cannot serve exact document_id filters
+            document_id_property = properties.get("document_id")
+            if document_id_property is None:
+                logger.warning(f"Collection {self.collection_name} has no document_id property, document filters will match nothing")
+            elif document_id_property.tokenization != wvc.Tokenization.FIELD:
+                self.exact_document_filter = False
+                logger.warning(
+                    f"document_id in {self.collection_name} uses {document_id_property.tokenization} tokenization; "
+                    "document filters are re-checked client-side, recreate the collection for exact-match filters"
+                )
+
+            for service_property in self._service_properties():
+                if service_property.name not in properties:
+                    self.collection.config.add_property(service_property)
+                    logger.info(f"Added property {service_property.name} to {self.collection_name}, run backfill_service_fields.py for existing chunks")
+        except Exception as e:
+            logger.warning(f"Could not inspect collection schema: {str(e)}")
+
+    @staticmethod
+    def _build_document_filter(document_ids: List[str]):
+        """Build a Weaviate filter restricting retrieval to the given documents.
+
+        Uses equal rather than contains_any: on a field-tokenized document_id
+        each comparison is an exact match of the whole id.
+        """
+        from weaviate.classes.query import Filter
+
+        if not document_ids:
+            return None
+        if len(document_ids) == 1:
+            return Filter.by_property("document_id").equal(document_ids[0])
+        return Filter.any_of([Filter.by_property("document_id").equal(document_id) for document_id in document_ids])
+
+    def _keep_documents(self, chunks: List[StoredChunk], document_ids: List[str]) -> List[StoredChunk]:
+        """Drop chunks a word-tokenized document_id filter matched by shared tokens only"""
+        if self.exact_document_filter or not document_ids:
+            return chunks
+        wanted = set(document_ids)
+        return [chunk for chunk in chunks if chunk.properties.get("document_id") in wanted]
+
+    @staticmethod
+    def _to_chunk(obj: Any) -> StoredChunk:
+        metadata = obj.metadata
+        return StoredChunk(
+            uuid=str(obj.uuid),
+            properties=dict(obj.properties),
+            vector=obj.vector.get("default") if obj.vector else None,
+            distance=metadata.distance if metadata is not None else None,
+            score=metadata.score if metadata is not None else None
+        )
+
+    def insert(self, properties: Dict[str, Any]) -> str:
+        return str(self.collection.data.insert(properties))
+
+    def update(self, chunk_uuid: str, properties: Dict[str, Any], vector: Optional[List[float]] = None) -> None:
+        self.collection.data.update(uuid=chunk_uuid, properties=properties, vector=vector)
+
+    def delete_document(self, document_id: str) -> int:
+        from weaviate.classes.query import Filter
+
+        document_filter = self._build_document_filter([document_id])
+        if not self.exact_document_filter:
+            # The filter could match other documents: delete the exact matches by uuid
+            chunk_uuids = []
+            offset = 0
+            while True:
+                response = self.collection.query.fetch_objects(
+                    filters=document_filter,
+                    return_properties=["document_id"],
+                    limit=1000,
+                    offset=offset
+                )
+                chunk_uuids.extend(str(obj.uuid) for obj in response.objects if obj.properties.get("document_id") == document_id)
+                if len(response.objects) < 1000:
+                    break
+                offset += len(response.objects)
+            if not chunk_uuids:
+                return 0
+            document_filter = Filter.by_id().contains_any(chunk_uuids)
+        result = self.collection.data.delete_many(where=document_filter)
+        return result.successful
+
+    def near_vector(self, vector: List[float], document_ids: List[str], limit: int) -> List[StoredChunk]:
+        from weaviate.classes.query import MetadataQuery
+
+        response = self.collection.query.near_vector(
+            near_vector=vector,
+            limit=limit,
+            filters=self._build_document_filter(document_ids),
+            return_metadata=MetadataQuery(distance=True)
+        )
+        return self._keep_documents([self._to_chunk(obj) for obj in response.objects], document_ids)
+
+    def bm25(self, query: str, document_ids: List[str], limit: int) -> List[StoredChunk]:
+        from weaviate.classes.query import MetadataQuery
+
+        response = self.collection.query.bm25(
+            query=query,
+            limit=limit,
+            filters=self._build_document_filter(document_ids),
+            return_metadata=MetadataQuery(score=True)
+        )
+        return self._keep_documents([self._to_chunk(obj) for obj in response.objects], document_ids)
+
+    def fetch_document(self, document_id: str, limit: int) -> List[StoredChunk]:
+        chunks: List[StoredChunk] = []
+        offset = 0
+        while len(chunks) < limit:
+            response = self.collection.query.fetch_objects(
+                filters=self._build_document_filter([document_id]),
+                include_vector=True,
+                limit=limit,
+                offset=offset
+            )
+            chunks.extend(self._keep_documents([self._to_chunk(obj) for obj in response.objects], [document_id]))
+            # Exact filters return the whole document in one page; other
+            # documents' chunks may have taken part of it otherwise
+            if self.exact_document_filter or len(response.objects) < limit:
+                break
+            offset += len(response.objects)
+        return chunks[:limit]
+
+    def iterate(self, properties: Optional[List[str]] = None, include_vector: bool = False) -> Iterator[StoredChunk]:
+        for obj in self.collection.iterator(include_vector=include_vector, return_properties=properties):
+            yield self._to_chunk(obj)
+
+    def count(self) -> int:
+        return self.collection.aggregate.over_all(total_count=True).total_count
+
+
+_TOKEN = re.compile(r"\w+")
+
+
+class InMemoryVectorStore(VectorStore):
+    """Process-local chunk store for offline runs and benchmarks.
+
+    Vectors come from ``embed`` (called with the texts of inserted chunks),
+    nearest-neighbour search is an exact cosine scan with NumPy and keyword
+    search is a plain BM25. Nothing is persisted.
+    """
+
+    def __init__(self, embed: Callable[[List[str]], List[List[float]]], k1: float = 1.2, b: float = 0.75):
+        self.embed = embed
+        self.k1 = k1
+        self.b = b
+        self._chunks: Dict[str, StoredChunk] = {}
+        self._terms: Dict[str, Dict[str, int]] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[str] = []
+        self._lock = threading.RLock()
+        self._connected = False
+
+    def connect(self) -> None:
+        self._connected = True
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def is_ready(self) -> bool:
+        return self._connected
+
+    def close(self) -> None:
+        self._connected = False
+
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        return _TOKEN.findall(text.lower())
+
+    def _index(self, chunk: StoredChunk) -> None:
+        terms: Dict[str, int] = {}
+        for term in self._tokenize(chunk.properties.get("text") or ""):
+            terms[term] = terms.get(term, 0) + 1
+        self._terms[chunk.uuid] = terms
+        self._matrix = None
+
+    def insert(self, properties: Dict[str, Any]) -> str:
+        vector = self.embed([properties.get("text") or ""])[0]
+        chunk = StoredChunk(uuid=str(uuid.uuid4()), properties=dict(properties), vector=list(vector))
+        with self._lock:
+            self._chunks[chunk.uuid] = chunk
+            self._index(chunk)
+        return chunk.uuid
+
+    def update(self, chunk_uuid: str, properties: Dict[str, Any], vector: Optional[List[float]] = None) -> None:
+        with self._lock:
+            chunk = self._chunks[chunk_uuid]
+            chunk.properties.update(properties)
+            if vector is not None:
+                chunk.vector = list(vector)
+            elif "text" in properties:
+                chunk.vector = list(self.embed([properties["text"] or ""])[0])
+            self._index(chunk)
+
+    def delete_document(self, document_id: str) -> int:
+        with self._lock:
+            doomed = [key for key, chunk in self._chunks.items() if chunk.properties.get("document_id") == document_id]
+            for key in doomed:
+                del self._chunks[key]
+                del self._terms[key]
+            if doomed:
+                self._matrix = None
+            return len(doomed)
+
+    def _candidates(self, document_ids: List[str]) -> List[StoredChunk]:
+        if not document_ids:
+            return list(self._chunks.values())
+        wanted = set(document_ids)
+        return [chunk for chunk in self._chunks.values() if chunk.properties.get("document_id") in wanted]
+
+    def _normalized_matrix(self) -> np.ndarray:
+        """Row-normalized matrix of every chunk vector, rebuilt lazily after writes"""
+        if self._matrix is None:
+            self._matrix_ids = list(self._chunks)
+            if self._matrix_ids:
+                matrix = np.array([self._chunks[key].vector for key in self._matrix_ids], dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                self._matrix = matrix / np.where(norms == 0, 1, norms)
+            else:
+                self._matrix = np.zeros((0, 0), dtype=np.float32)
+        return self._matrix
+
+    def near_vector(self, vector: List[float], document_ids: List[str], limit: int) -> List[StoredChunk]:
+        with self._lock:
+            matrix = self._normalized_matrix()
+            if not self._matrix_ids:
+                return []
+            query = np.array(vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            similarities = matrix @ (query / norm if norm else query)
+            if document_ids:
+                wanted = set(document_ids)
+                mask = np.array([self._chunks[key].properties.get("document_id") in wanted for key in self._matrix_ids])
+                similarities = np.where(mask, similarities, -np.inf)
+            order = np.argsort(-similarities)[:limit]
+            return [
+                StoredChunk(
+                    uuid=self._matrix_ids[i],
+                    properties=dict(self._chunks[self._matrix_ids[i]].properties),
+                    distance=float(1.0 - similarities[i])
+                )
+                for i in order if similarities[i] != -np.inf
+            ]
+
+    def bm25(self, query: str, document_ids: List[str], limit: int) -> List[StoredChunk]:
+        query_terms = set(self._tokenize(query))
+        with self._lock:
+            candidates = self._candidates(document_ids)
+            if not candidates or not query_terms:
+                return []
+            lengths = {chunk.uuid: sum(self._terms[chunk.uuid].values()) for chunk in candidates}
+            average_length = sum(lengths.values()) / len(lengths) or 1.0
+            document_frequency = {
+                term: sum(1 for chunk in candidates if term in self._terms[chunk.uuid])
+                for term in query_terms
+            }
+
+            scored = []
+            for chunk in candidates:
+                terms = self._terms[chunk.uuid]
+                score = 0.0
+                for term in query_terms:
+                    frequency = terms.get(term, 0)
+                    if not frequency:
+                        continue
+                    idf = math.log(1 + (len(candidates) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                    norm = frequency + self.k1 * (1 - self.b + self.b * lengths[chunk.uuid] / average_length)
+                    score += idf * frequency * (self.k1 + 1) / norm
+                if score > 0:
+                    scored.append((score, chunk))
+
+            scored.sort(key=lambda item: item[0], reverse=True)
+            return [
+                StoredChunk(uuid=chunk.uuid, properties=dict(chunk.properties), score=score)
+                for score, chunk in scored[:limit]
+            ]
+
+    def fetch_document(self, document_id: str, limit: int) -> List[StoredChunk]:
+        with self._lock:
+            return [
+                StoredChunk(uuid=chunk.uuid, properties=dict(chunk.properties), vector=list(chunk.vector))
+                for chunk in self._candidates([document_id])[:limit]
+            ]
+
+    def iterate(self, properties: Optional[List[str]] = None, include_vector: bool = False) -> Iterator[StoredChunk]:
+        with self._lock:
+            chunks = list(self._chunks.values())
+        for chunk in chunks:
+            selected = chunk.properties if properties is None else {
+                name: chunk.properties.get(name) for name in properties
+            }
+            yield StoredChunk(
+                uuid=chunk.uuid,
+                properties=dict(selected),
+                vector=list(chunk.vector) if include_vector else None
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._chunks)